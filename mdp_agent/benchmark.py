@@ -0,0 +1,137 @@
+# benchmark.py
+#
+# Times MDPAgent.getAction with each of the solvers in Config.solver.
+#
+# For every layout, one game is played with value iteration and RandomGhosts
+# to record a sequence of game states. A fresh agent is then timed on that
+# same sequence of states for each solver, so all solvers see identical inputs.
+#
+# With --successors it times the engine itself instead: the moves of seeded
+# games with random moves are recorded, and the time per successor spent in
+# GameState.generateSuccessor, in hashing the successor and in copying its
+# AgentStates is reported.
+#
+# Usage:
+#   python benchmark.py                       (every layout in layouts/)
+#   python benchmark.py -l originalClassic -n 200
+#   python benchmark.py --successors -l mediumClassic
+
+import os
+import random
+import time
+from optparse import OptionParser
+
+import layout
+import pacman
+from ghostAgents import RandomGhost
+from map import Config
+from mdpAgents import MDPAgent
+
+SOLVERS = ["vi", "pi", "mpi"]
+
+
+# Plays up to max_ticks Pacman moves and returns the states Pacman had to act in
+def recordStates(gameLayout, max_ticks, seed):
+    random.seed(seed)
+    Config.solver = "vi"
+    state = pacman.GameState()
+    state.initialize(gameLayout, gameLayout.getNumGhosts())
+    agents = [MDPAgent()] + [RandomGhost(i + 1) for i in range(gameLayout.getNumGhosts())]
+    agents[0].registerInitialState(state.deepCopy())
+    states = []
+    agentIndex = 0
+    while not (state.isWin() or state.isLose()) and len(states) < max_ticks:
+        if agentIndex == 0:
+            states.append(state)
+        action = agents[agentIndex].getAction(state)
+        state = state.generateSuccessor(agentIndex, action)
+        agentIndex = (agentIndex + 1) % len(agents)
+    return states
+
+
+# Mean and max milliseconds a fresh agent spends in getAction for each of the states
+def timeSolver(solver, states):
+    Config.solver = solver
+    agent = MDPAgent()
+    agent.registerInitialState(states[0].deepCopy())
+    times = []
+    for state in states:
+        start = time.time()
+        agent.getAction(state)
+        times.append(time.time() - start)
+    return 1000 * sum(times) / len(times), 1000 * max(times)
+
+
+# Records the moves of seeded games with random moves, as (state, agent index, action)
+def recordMoves(gameLayout, games, seed):
+    random.seed(seed)
+    moves = []
+    for i in range(games):
+        state = pacman.GameState()
+        state.initialize(gameLayout, gameLayout.getNumGhosts())
+        agentIndex = 0
+        while not (state.isWin() or state.isLose()):
+            action = random.choice(state.getLegalActions(agentIndex))
+            moves.append((state, agentIndex, action))
+            state = state.generateSuccessor(agentIndex, action)
+            agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return moves
+
+
+# Number of successors and microseconds per successor spent generating it, hashing it and
+# copying its AgentStates
+def timeSuccessors(moves):
+    start = time.time()
+    successors = [state.generateSuccessor(agentIndex, action) for state, agentIndex, action in moves]
+    generateSeconds = time.time() - start
+    start = time.time()
+    for successor in successors:
+        hash(successor)
+    hashSeconds = time.time() - start
+    start = time.time()
+    for successor in successors:
+        for agentState in successor.data.agentStates:
+            agentState.copy()
+    copySeconds = time.time() - start
+    count = len(successors)
+    return count, 1e6 * generateSeconds / count, 1e6 * hashSeconds / count, 1e6 * copySeconds / count
+
+
+def layoutNames():
+    return sorted(name[:-len(".lay")] for name in os.listdir("layouts") if name.endswith(".lay"))
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-l', '--layout', dest='layout', default=None,
+                      help='Only benchmark this layout [Default: every layout in layouts/]')
+    parser.add_option('-n', '--ticks', dest='ticks', type='int', default=100,
+                      help='Maximum number of Pacman moves to time per layout [Default: %default]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=1,
+                      help='Random seed for the recorded game [Default: %default]')
+    parser.add_option('--successors', action='store_true', dest='successors', default=False,
+                      help='Time generating and hashing successor states instead of the solvers')
+    parser.add_option('-g', '--games', dest='games', type='int', default=100,
+                      help='Number of random games to record per layout with --successors [Default: %default]')
+    options, otherjunk = parser.parse_args()
+
+    default_solver = Config.solver
+    names = [options.layout] if options.layout else layoutNames()
+    if options.successors:
+        print("%-22s %10s %16s %16s %16s" % ("layout", "successors", "generate us", "hash us", "copy us"))
+        for name in names:
+            moves = recordMoves(layout.getLayout(name), options.games, options.seed)
+            print("%-22s %10d %16.2f %16.2f %16.2f" % ((name,) + timeSuccessors(moves)))
+        raise SystemExit
+    print("%-22s %6s %6s" % ("layout", "cells", "ticks") + "".join(" %16s" % (solver + " ms mean/max") for solver in SOLVERS))
+    for name in names:
+        gameLayout = layout.getLayout(name)
+        states = recordStates(gameLayout, options.ticks, options.seed)
+        if not states:
+            continue
+        cells = len(gameLayout.walls.asList(False))
+        row = "%-22s %6d %6d" % (name, cells, len(states))
+        for solver in SOLVERS:
+            row += " %8.2f/%7.2f" % timeSolver(solver, states)
+        print(row)
+    Config.solver = default_solver
@@ -67,18 +67,23 @@ class Directions:
                WEST: EAST,
                STOP: STOP}
 
-class Configuration:
+class Configuration(object):
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
     traveling direction.
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are shared between states and agent states, so they are never modified:
+    generateSuccessor returns a new one. This lets the hash be computed once and kept.
     """
+    __slots__ = ('pos', 'direction', '_hash')
 
     def __init__(self, pos, direction):
         self.pos = pos
         self.direction = direction
+        self._hash = None
 
     def getPosition(self):
         return (self.pos)
@@ -91,13 +96,24 @@ class Configuration:
         return x == int(x) and y == int(y)
 
     def __eq__(self, other):
-        if other == None: return False
+        if other is None: return False
+        if other is self: return True
         return (self.pos == other.pos and self.direction == other.direction)
 
     def __hash__(self):
-        x = hash(self.pos)
-        y = hash(self.direction)
-        return hash(x + 13 * y)
+        if self._hash is None:
+            x = hash(self.pos)
+            y = hash(self.direction)
+            self._hash = hash(x + 13 * y)
+        return self._hash
+
+    # The hash is not pickled, it is computed again when needed
+    def __getstate__(self):
+        return self.pos, self.direction
+
+    def __setstate__(self, state):
+        self.pos, self.direction = state
+        self._hash = None
 
     def __str__(self):
         return "(x,y)="+str(self.pos)+", "+str(self.direction)
@@ -117,10 +133,15 @@ class Configuration:
             direction = self.direction # There is no stop direction
         return Configuration((x + dx, y+dy), direction)
 
-class AgentState:
+class AgentState(object):
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
+
+    The rules only modify an agent state right after copying it for a successor (see
+    GameStateData.ownAgentState), so once a state is generated its agent states do not change
+    and their hashes are computed once and kept.
     """
+    __slots__ = ( 'start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned', '_hash' )
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -129,6 +150,7 @@ class AgentState:
         self.scaredTimer = 0
         self.numCarrying = 0
         self.numReturned = 0
+        self._hash = None
 
     def __str__( self ):
         if self.isPacman:
@@ -137,93 +159,167 @@ class AgentState:
             return "Ghost: " + str( self.configuration )
 
     def __eq__( self, other ):
-        if other == None:
+        if other is None:
             return False
         return self.configuration == other.configuration and self.scaredTimer == other.scaredTimer
 
     def __hash__(self):
-        return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
+        if self._hash is None:
+            self._hash = hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
+        return self._hash
+
+    # The hash is not pickled, it is computed again when needed
+    def __getstate__( self ):
+        return self.start, self.configuration, self.isPacman, self.scaredTimer, self.numCarrying, self.numReturned
+
+    def __setstate__( self, state ):
+        self.start, self.configuration, self.isPacman, self.scaredTimer, self.numCarrying, self.numReturned = state
+        self._hash = None
 
     def copy( self ):
-        state = AgentState( self.start, self.isPacman )
+        # Skips __init__, which would only set fields that are overwritten here
+        state = AgentState.__new__( AgentState )
+        state.start = self.start
+        state.isPacman = self.isPacman
         state.configuration = self.configuration
         state.scaredTimer = self.scaredTimer
         state.numCarrying = self.numCarrying
         state.numReturned = self.numReturned
+        state._hash = None
         return state
 
     def getPosition(self):
-        if self.configuration == None: return None
+        if self.configuration is None: return None
         return self.configuration.getPosition()
 
     def getDirection(self):
         return self.configuration.getDirection()
 
-class Grid:
+# Number of set bits of a non-negative int or long
+def popcount(bits):
+    return bin(bits).count('1')
+
+class Grid(object):
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
+    A 2-dimensional array of booleans backed by the bits of an int.  Data is accessed
     via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
     y vertical and the origin (0,0) in the bottom left corner.
 
+    Cell (x, y) is bit x * height + y of bits, so counting, hashing, comparing and copying
+    a grid are operations on a single int. The columns returned by grid[x] are tuples
+    unpacked from the bits the first time they are read, cells are changed with set(x, y, value).
+
     The __str__ method constructs an output that is oriented like a pacman board.
     """
+
+    CELLS_PER_INT = 30
+
     def __init__(self, width, height, initialValue=False, bitRepresentation=None):
         if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
-        self.CELLS_PER_INT = 30
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        self.bits = (1 << (width * height)) - 1 if initialValue else 0
+        self._count = width * height if initialValue else 0
+        self._hash = None
+        self._columns = [None] * width
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
+    @staticmethod
+    def fromBits(width, height, bits):
+        """
+        The grid whose cell (x, y) is bit x * height + y of bits
+        """
+        g = Grid(width, height)
+        g.bits = bits
+        g._count = popcount(bits)
+        return g
+
+    def _unpackColumn(self, x):
+        height = self.height
+        cells = format((self.bits >> (x % self.width * height)) & ((1 << height) - 1), 'b')[::-1]
+        return tuple(map('1'.__eq__, cells.ljust(height, '0')))
+
+    def set(self, x, y, value):
+        mask = 1 << (x * self.height + y)
+        if value and not self.bits & mask:
+            self.bits |= mask
+            self._count += 1
+        elif not value and self.bits & mask:
+            self.bits &= ~mask
+            self._count -= 1
+        else:
+            return
+        self._hash = None
+        self._columns[x] = None
+
+    @property
+    def data(self):
+        return [self[x] for x in range(self.width)]
+
     def __getitem__(self, i):
-        return self.data[i]
+        column = self._columns[i]
+        if column is None:
+            column = self._columns[i] = self._unpackColumn(i)
+        return column
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        for y in range(self.height):
+            self.set(key, y, item[y])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_columns'] = [None] * self.width
+        return state
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
     def __eq__(self, other):
-        if other == None: return False
-        return self.data == other.data
+        if other is None: return False
+        return self.bits == other.bits and self.width == other.width and self.height == other.height
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        if self._hash is None:
+            self._hash = hash(self.bits)
+        return self._hash
 
     def copy(self):
-        g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g = Grid.__new__(Grid)
+        g.width = self.width
+        g.height = self.height
+        g.bits = self.bits
+        g._count = self._count
+        g._hash = self._hash
+        g._columns = [None] * self.width
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        # A shallow copy shares its cells with the grid, writes to either are seen by both
+        return self
 
     def count(self, item =True ):
-        return sum([x.count(item) for x in self.data])
+        return self._count if item else self.width * self.height - self._count
 
     def asList(self, key = True):
+        bits = self.bits if key else ~self.bits & ((1 << (self.width * self.height)) - 1)
+        # The set bits are found in the binary string of the int, lowest bit first
+        cells = format(bits, 'b')[::-1]
+        height = self.height
         list = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
+        index = cells.find('1')
+        while index >= 0:
+            list.append( (index // height, index % height) )
+            index = cells.find('1', index + 1)
         return list
 
     def packBits(self):
@@ -236,8 +332,7 @@ class Grid:
         currentInt = 0
         for i in range(self.height * self.width):
             bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
+            if (self.bits >> i) & 1:
                 currentInt += 2 ** bit
             if (i + 1) % self.CELLS_PER_INT == 0:
                 bits.append(currentInt)
@@ -246,7 +341,7 @@ class Grid:
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -258,8 +353,7 @@ class Grid:
         for packed in bits:
             for bit in self._unpackInt(packed, self.CELLS_PER_INT):
                 if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
+                self.set(cell // self.height, cell % self.height, bit)
                 cell += 1
 
     def _unpackInt(self, packed, size):
@@ -375,14 +469,20 @@ class GameStateData:
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        The food Grid, the capsules tuple and the agent states are shared with the
+        predecessor rather than copied: they are replaced, never modified in place, and an
+        agent state is only copied when the rules change it (see ownAgentState).
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+        # Bit i is set once agentStates[i] is this packet's own copy, which the rules may modify
+        self._ownedAgents = 0
 
         self._foodEaten = None
         self._foodAdded = None
@@ -393,20 +493,24 @@ class GameStateData:
         self.scoreChange = 0
 
     def deepCopy( self ):
+        # Nothing is modified in place (see __init__) and the layout does not change during a game,
+        # so the copy shares everything with this packet
         state = GameStateData( self )
-        state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
         return state
 
-    def copyAgentStates( self, agentStates ):
-        copiedStates = []
-        for agentState in agentStates:
-            copiedStates.append( agentState.copy() )
-        return copiedStates
+    def ownAgentState( self, agentIndex ):
+        """
+        Returns the state of the given agent for the rules to modify, copying it first
+        if it is still shared with the predecessor.
+        """
+        if not self._ownedAgents >> agentIndex & 1:
+            self.agentStates[agentIndex] = self.agentStates[agentIndex].copy()
+            self._ownedAgents |= 1 << agentIndex
+        return self.agentStates[agentIndex]
 
     def __eq__( self, other ):
         """
@@ -424,17 +528,12 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
         return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
+        # The characters of the board, as map[x][y]
+        map = [[' '] * height for x in range(width)]
         if type(self.food) == type((1,2)):
             self.food = reconstituteGrid(self.food)
         for x in range(width):
@@ -455,7 +554,9 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = 'o'
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        rows = [''.join([map[x][y] for x in range(width)]) for y in range(height)]
+        rows.reverse()
+        return '\n'.join(rows) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr( self, hasFood, hasWall ):
         if hasFood:
@@ -490,7 +591,7 @@ class GameStateData:
         """
         self.food = layout.food.copy()
         #self.capsules = []
-        self.capsules = layout.capsules[:]
+        self.capsules = tuple( layout.capsules )
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
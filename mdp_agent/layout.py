@@ -18,23 +18,24 @@ import os
 import random
 
 VISIBILITY_MATRIX_CACHE = {}
+# Parsed Layouts, keyed by layout name and text (see loadLayout)
+LAYOUT_CACHE = {}
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+    It does not change once parsed, so every game and state on the board shares it.
     """
 
     def __init__(self, layoutText):
         self.width = len(layoutText[0])
         self.height= len(layoutText)
-        self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.totalFood = self.food.count()
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -90,7 +91,8 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts are immutable, so a copy is the layout itself
+        return self
 
     def processLayoutText(self, layoutText):
         """
@@ -106,19 +108,25 @@ class Layout:
         Other characters are ignored.
         """
         maxY = self.height - 1
+        # Walls and food are collected as the bits of their Grids (see game.Grid)
+        walls = 0
+        food = 0
         for y in range(self.height):
             for x in range(self.width):
                 layoutChar = layoutText[maxY - y][x]
-                self.processLayoutChar(x, y, layoutChar)
+                if layoutChar == '%':
+                    walls |= 1 << (x * self.height + y)
+                elif layoutChar == '.':
+                    food |= 1 << (x * self.height + y)
+                else:
+                    self.processLayoutChar(x, y, layoutChar)
+        self.walls = Grid.fromBits(self.width, self.height, walls)
+        self.food = Grid.fromBits(self.width, self.height, food)
         self.agentPositions.sort()
         self.agentPositions = [ ( i == 0, pos) for i, pos in self.agentPositions]
 
     def processLayoutChar(self, x, y, layoutChar):
-        if layoutChar == '%':
-            self.walls[x][y] = True
-        elif layoutChar == '.':
-            self.food[x][y] = True
-        elif layoutChar == 'o':
+        if layoutChar == 'o':
             self.capsules.append((x, y))
         elif layoutChar == 'P':
             self.agentPositions.append( (0, (x, y) ) )
@@ -145,5 +153,17 @@ def getLayout(name, back = 2):
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
-    try: return Layout([line.strip() for line in f])
+    try: return loadLayout([line.strip() for line in f], fullname)
     finally: f.close()
+
+def loadLayout(layoutText, name = None):
+    """
+    Returns the Layout of the given lines of text, which is only parsed the first time
+    the same name and text are loaded.
+    """
+    key = (name, tuple(layoutText))
+    layout = LAYOUT_CACHE.get(key)
+    if layout is None:
+        layout = Layout(key[1])
+        LAYOUT_CACHE[key] = layout
+    return layout
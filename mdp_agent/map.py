@@ -1,5 +1,16 @@
+from array import array
+
 import api 
 
+try:
+    import numpy
+    _NUMPY_ENABLED = True
+except ImportError:
+    _NUMPY_ENABLED = False
+
+# TransitionModels already built, keyed by the text of the wall layout and the motion probabilities
+TRANSITION_MODEL_CACHE = {}
+
 class Config:
     discount_factor = 0.9
     possibility_straight = 0.8
@@ -14,163 +25,232 @@ class Config:
     reward_ghost_neighbour_first = -500.0
     # Neighbour of the neighbouring cell has a ghost
     reward_ghost_neighbour_second = -250.0
+    # Reward of a cell by its maze distance to the nearest ghost: [on the ghost, one move away, two moves away, ...]
+    # Cells further away than the table is long get their usual reward. None for [reward_ghost,
+    # reward_ghost_neighbour_first], read when the map is updated. Set it to [reward_ghost, reward_ghost_neighbour_first,
+    # reward_ghost_neighbour_second] to keep Pacman two moves away from the ghosts as well
+    ghost_distance_rewards = None
+    # Set to True to stop avoiding ghosts that stay scared for more than "scared_ghost_margin" moves
+    ignore_scared_ghosts = False
+    scared_ghost_margin = 2
     number_of_iterations = 100
     # Set to True if run value iteration until full convergence, otherwise the iteration will be run "number_of_iterations" times
     run_until_until_convergence = False
     # When the difference between iterations is smaller than this amount, finish the value iteration. The values have now converged
     convergence_difference = 0.01
+    # Which MDP solver the agent runs: "vi" value iteration, "pi" policy iteration or "mpi" modified policy iteration
+    # Policy iteration needs NumPy
+    solver = "vi"
+    # Number of evaluation sweeps modified policy iteration runs for each policy
+    policy_evaluation_sweeps = 10
+    # Set to True to run value iteration over flat arrays of WalkableCells (needs NumPy), otherwise every sweep walks the grid cell by cell
+    vectorised_value_iteration = True
+    # Set to True to keep the utilities of the previous tick and iterate them until convergence instead of starting from 0.0 every move
+    warm_start = False
+    # Set to True to run Gauss-Seidel value iteration, where each cell's new utility is used straight away by the cells after it
+    gauss_seidel = False
+    # Order of the cells in a Gauss-Seidel sweep: "row" (row by row), "alternating" (row by row, reversed every other sweep)
+    # or "bfs" (breadth first outwards from Pacman)
+    sweep_order = "row"
+    # Set to True to keep the utilities between ticks and only back up the cells around what changed (food eaten, ghosts moved)
+    prioritized_sweeping = False
+    # Prioritized sweeping stops once no queued cell's utility would change by more than this amount
+    prioritized_sweeping_threshold = 0.01
+
+    # The rewards by distance to the nearest ghost that are in use (see ghost_distance_rewards)
+    @staticmethod
+    def ghostDistanceRewards():
+        if Config.ghost_distance_rewards is not None:
+            return Config.ghost_distance_rewards
+        return [Config.reward_ghost, Config.reward_ghost_neighbour_first]
 
 # Representation of the map that is stored in the Pacman's "head"
+# Every WalkableCell has a flat index (row by row, bottom to top) and what is known about the cells is kept
+# in parallel arrays indexed by it, so the solvers never have to go through Cell objects
 class PacmanMap:
     def __init__(self, state):
-        self.height = 0
-        self.width = 0
-        self.grid = self.initGrid(state)
+        wallGrid = state.getWalls()
+        self.width = wallGrid.width
+        self.height = wallGrid.height
+        # 1 for every wall, indexed by x + y * width
+        self.walls = bytearray(self.width * self.height)
+        # Index of the WalkableCell at x + y * width, or -1 for walls
+        self.cellIndex = array('i', [-1]) * (self.width * self.height)
+        # (x, y) of each WalkableCell
+        self.positions = []
+        self.indexCells(wallGrid)
+        count = len(self.positions)
+        self.food = bytearray(count)
+        self.capsules = bytearray(count)
+        self.ghosts = bytearray(count)
+        self.utilities = array('d', [0.0]) * count
+        # Indices of the (north, east, south, west) neighbours of each WalkableCell
+        self.neighbours = []
+        self.findNeighbours()
         self.cellsWithGhosts = []
         self.cellsWithCapsules = []
         self.ghostPrevious = []
-        self.draw(state)
+        # Cells with ghosts that Pacman has to avoid (all of them unless Config.ignore_scared_ghosts)
+        self.cellsWithDangerousGhosts = []
+        # Maze distance from each WalkableCell to the nearest dangerous ghost, None if it is further away than
+        # the ghost distance rewards reach, and the cells that are close enough to have a distance
+        self.ghostDistances = [None] * count
+        self.ghostDistanceRewards = Config.ghostDistanceRewards()
+        self.cellsNearGhosts = []
+        # Indices of the WalkableCells whose reward may have changed since the previous update
+        self.changedCells = set()
+        self.transitionModel = None
+        if _NUMPY_ENABLED:
+            self.transitionModel = TransitionModel.forWalls(wallGrid, self.neighbours)
         self.fill(state)
 
-    # Updates the grid according to the newest state
+    # Updates the arrays according to the newest state
     def update(self, state):
-        cell = self.getCell(api.whereAmI(state))
-        self.markCapsules(cell)
-        cell.hasFood = False
-        cell.hasCapsule = False
+        index = self.indexOf(api.whereAmI(state))
+        self.changedCells = set()
+        if self.food[index] or self.capsules[index]:
+            self.changedCells.add(index)
+        self.markCapsules(index)
+        self.food[index] = 0
+        self.capsules[index] = 0
         self.markGhosts(state)
+        self.markGhostDistances()
 
-    # Gives a Cell in the specified position
-    def getCell(self, position):
-        return self.grid[position[1]][position[0]]    
-    
-    # Gives a Cell above the specified position
-    def topCell(self, position):
-        return self.grid[position[1] + 1][position[0]]
-
-    # Gives a Cell below the specified position
-    def bottomCell(self, position):
-        return self.grid[position[1] - 1][position[0]]
+    # Gives the index of the WalkableCell in the specified position, or -1 if it is a wall
+    def indexOf(self, position):
+        return self.cellIndex[position[0] + position[1] * self.width]
 
-    # Gives a Cell right of the specified position
-    def leftCell(self, position):
-        return self.grid[position[1]][position[0] - 1]
-
-    # Gives a Cell right of the specified position
-    def rightCell(self, position):
-        return self.grid[position[1]][position[0] + 1]
+    # Gives a Cell view of the specified position
+    def getCell(self, position):
+        index = self.indexOf(position)
+        if index < 0:
+            return WallCell(position[0], position[1])
+        return WalkableCell(self, index)
 
     # Update the list containing capsules
-    def markCapsules(self, currentCell):
-        if(currentCell.hasCapsule):
-            self.cellsWithCapsules.remove(currentCell)
-
-    # Checks in neighbouring WalkableCells have ghosts
-    def hasGhostClose(self, coordinates):
-        if coordinates[1] + 1 < self.height:
-            top = self.topCell(coordinates)
-            if(isinstance(top, WalkableCell)):
-                if top.hasGhost:
-                    return True
-        if coordinates[1] - 1 >= 0:
-            bottom = self.bottomCell(coordinates)
-            if(isinstance(bottom, WalkableCell)):
-                if bottom.hasGhost:
-                    return True
-        if coordinates[0] - 1 >= 0:        
-            left = self.leftCell(coordinates)
-            if(isinstance(left, WalkableCell)):
-                if left.hasGhost:
-                    return True
-        if coordinates[0] + 1 < self.width:
-            right = self.rightCell(coordinates)
-            if(isinstance(right, WalkableCell)):
-                if right.hasGhost:
-                    return True
-        return False
-    
-    # Checks if the neighbouring cells of the neighbouring cells have ghosts
-    def neighbourHasGhostClose(self, coordinates):
-        if self.hasGhostClose((coordinates[0] + 1, coordinates[1])) or self.hasGhostClose((coordinates[0] - 1, coordinates[1])) or self.hasGhostClose((coordinates[0], coordinates[1] + 1)) or self.hasGhostClose((coordinates[0], coordinates[1] - 1)):
-            return True
-        else:
-            return False
+    def markCapsules(self, index):
+        if self.capsules[index]:
+            self.cellsWithCapsules.remove(index)
 
     # Marks which cells ghosts currently occupy
     def markGhosts(self, state):
-        # Remoes ghosts from all Cells
-        self.ghostPrevious = []
-        for cell in self.cellsWithGhosts:
-            cell.hasGhost = False
-            self.ghostPrevious.append(cell)
+        # Removes ghosts from all cells
+        self.ghostPrevious = self.cellsWithGhosts
+        for index in self.cellsWithGhosts:
+            self.ghosts[index] = 0
 
-        # Marks them again using the newest state (if ghosts qchanged the position)
+        # Marks them again using the newest state (if ghosts changed the position)
         self.cellsWithGhosts = []
-        ghosts = api.ghosts(state)
-        for ghost in ghosts:
-            y = int(ghost[1])
-            x = int(ghost[0])
-            cell = self.grid[y][x]
-            cell.hasGhost = True
-            self.cellsWithGhosts.append(cell)
-        
+        self.cellsWithDangerousGhosts = []
+        ghosts = api.ghostStatesWithTimes(state)
+        for (ghost, scared_time) in ghosts:
+            index = self.indexOf((int(ghost[0]), int(ghost[1])))
+            if index >= 0:
+                self.ghosts[index] = 1
+                self.cellsWithGhosts.append(index)
+                if not (Config.ignore_scared_ghosts and scared_time > Config.scared_ghost_margin):
+                    self.cellsWithDangerousGhosts.append(index)
+
+    # Breadth first search from all the dangerous ghosts at once, through the walkable cells, that finds the distance
+    # to the nearest one for every cell within reach of the ghost distance rewards (see Config.ghost_distance_rewards).
+    # Cells whose distance changed are added to the changed cells
+    def markGhostDistances(self):
+        previous_distances = self.ghostDistances
+        previous_cells = self.cellsNearGhosts
+        self.ghostDistanceRewards = Config.ghostDistanceRewards()
+        radius = len(self.ghostDistanceRewards) - 1
+        distances = [None] * len(self.positions)
+        frontier = []
+        for index in self.cellsWithDangerousGhosts:
+            if distances[index] is None:
+                distances[index] = 0
+                frontier.append(index)
+        cells = list(frontier)
+        distance = 0
+        while frontier and distance < radius:
+            distance += 1
+            next_frontier = []
+            for index in frontier:
+                for neighbours in self.neighbours:
+                    neighbour = neighbours[index]
+                    if distances[neighbour] is None:
+                        distances[neighbour] = distance
+                        next_frontier.append(neighbour)
+            cells.extend(next_frontier)
+            frontier = next_frontier
+        self.ghostDistances = distances
+        self.cellsNearGhosts = cells
+
+        for index in previous_cells:
+            if distances[index] != previous_distances[index]:
+                self.changedCells.add(index)
+        for index in cells:
+            if distances[index] != previous_distances[index]:
+                self.changedCells.add(index)
+
     # Makes the utilities of all the WalkableCells in the map 0.0    
     def overrideUtilities(self):
-        for y in range(self.height):
-            for x in range(self.width):
-                coordinates = (x, y)
-                if isinstance(self.getCell(coordinates), WalkableCell):
-                    self.getCell(coordinates).utility = 0.0
+        self.utilities = array('d', [0.0]) * len(self.positions)
+
+    # Replaces the utilities of all the WalkableCells with the given values (in index order)
+    def setUtilities(self, utilities):
+        self.utilities = array('d', utilities)
 
     # =================================
     # Creation methods called only once
     # =================================
 
-    # Fills the grid when it is first initialised
+    # Fills the arrays when they are first initialised
     def fill(self, state):
         self.fillWithFood(state)
         self.fillWithCapsules(state)
         self.markGhosts(state)
+        self.markGhostDistances()
 
     # Determines which of the WalkableCells have food in them
     def fillWithFood(self, state):
         foodGrid = state.getFood()
-        for y in range(self.height):
-            for x in range(self.width):
-                if foodGrid[x][y] == True:
-                    self.grid[y][x].hasFood = True
+        for (index, (x, y)) in enumerate(self.positions):
+            if foodGrid[x][y] == True:
+                self.food[index] = 1
 
     # Determines which of the WalkableCells have capsules in them
     def fillWithCapsules(self, state):
         capsules = api.capsules(state)
         for capsule in capsules:
-            y = capsule[1]
-            x = capsule[0]
-            cell = self.grid[y][x]
-            cell.hasCapsule = True
-            cell.hasFood = False
-            self.cellsWithCapsules.append(cell)
-
-    # Creates a 2D matrix with all the positions as None and assigns to the grid variable
-    def initGrid(self, state):
-        wallGrid = state.getWalls()
-        self.width = wallGrid.width
-        self.height = wallGrid.height
-        grid = [[None for x in range(self.width)] for y in range(self.height)]
-        return grid
+            index = self.indexOf(capsule)
+            self.capsules[index] = 1
+            self.food[index] = 0
+            self.cellsWithCapsules.append(index)
 
-    # Each cell of the matrix is assigned either a WallCell or a WalkableCell
-    def draw(self, state):
-        wallGrid = state.getWalls()
-
-        # Mark walls and walkable cells
-        for x in range(self.width):
-            for y in range(self.height):
+    # Marks the walls and gives every WalkableCell its index (row by row, bottom to top)
+    def indexCells(self, wallGrid):
+        for y in range(self.height):
+            for x in range(self.width):
                 if wallGrid[x][y] == True:
-                    self.grid[y][x] = WallCell(x, y)
+                    self.walls[x + y * self.width] = 1
                 else:
-                    self.grid[y][x] = WalkableCell(x, y)
-                    
+                    self.cellIndex[x + y * self.width] = len(self.positions)
+                    self.positions.append((x, y))
+
+    # Stores the indices of the (north, east, south, west) neighbours of every WalkableCell
+    # A neighbouring wall points back at the cell itself, as Pacman bounces off walls
+    def findNeighbours(self):
+        north, east, south, west = [], [], [], []
+        for (index, (x, y)) in enumerate(self.positions):
+            north.append(self.neighbourIndex(index, (x, y + 1)))
+            east.append(self.neighbourIndex(index, (x + 1, y)))
+            south.append(self.neighbourIndex(index, (x, y - 1)))
+            west.append(self.neighbourIndex(index, (x - 1, y)))
+        self.neighbours = [north, east, south, west]
+
+    # Index of the cell Pacman ends up in when moving to the given position, which is the cell itself when it is a wall
+    def neighbourIndex(self, index, position):
+        neighbour = self.indexOf(position)
+        if neighbour < 0:
+            return index
+        return neighbour
+
     # =================================
     # Printing methods
     # =================================
@@ -180,16 +260,17 @@ class PacmanMap:
         print("\n\n\n")
         for y in reversed(range(self.height)):
             for x in range(self.width):
-                if isinstance(self.grid[y][x], WallCell):
+                cell = self.getCell((x, y))
+                if isinstance(cell, WallCell):
                     print("#"),
                 else:
                     if y == pacman_coordinates[1] and x == pacman_coordinates[0]:
                         print("M"),
-                    elif self.grid[y][x].hasCapsule:
+                    elif cell.hasCapsule:
                         print("o"),
-                    elif self.grid[y][x].hasGhost:
+                    elif cell.hasGhost:
                         print("G"),
-                    elif self.grid[y][x].hasFood:
+                    elif cell.hasFood:
                         print("."),
                     else:
                         print("_"),
@@ -201,15 +282,16 @@ class PacmanMap:
         print("\n\n\n")
         for y in reversed(range(self.height)):
             for x in range(self.width):
-                if isinstance(self.grid[y][x], WallCell):
+                cell = self.getCell((x, y))
+                if isinstance(cell, WallCell):
                     print(" ## "),
                 else:
                     if y == pacman_coordinates[1] and x == pacman_coordinates[0]:
                         print("MMM"),
-                    elif self.getCell((x, y)).hasGhost:
-                        print("!" + str("%.1f" % self.grid[y][x].utility)),
+                    elif cell.hasGhost:
+                        print("!" + str("%.1f" % cell.utility)),
                     else:
-                        print(str("%.2f" % self.grid[y][x].utility)),
+                        print(str("%.2f" % cell.utility)),
             print("")
         print("\n\n\n")
 
@@ -222,13 +304,29 @@ class Cell(object):
 
 
 # A subclass of Cell which indicates that Pacman can stand in this Cell
+# Read-only view of one WalkableCell of a PacmanMap, only used for printing and debugging
 class WalkableCell(Cell):
-    def __init__(self, x, y, hasFood = False, hasCapsule = False, hasGhost = False, utility = 0.0):
+    def __init__(self, pacmanMap, index):
+        (x, y) = pacmanMap.positions[index]
         super(WalkableCell, self).__init__(x, y)
-        self.hasFood = hasFood
-        self.hasCapsule = hasCapsule
-        self.hasGhost = hasGhost
-        self.utility = utility
+        self.map = pacmanMap
+        self.index = index
+
+    @property
+    def hasFood(self):
+        return self.map.food[self.index] == 1
+
+    @property
+    def hasCapsule(self):
+        return self.map.capsules[self.index] == 1
+
+    @property
+    def hasGhost(self):
+        return self.map.ghosts[self.index] == 1
+
+    @property
+    def utility(self):
+        return self.map.utilities[self.index]
 
 
 # A subclass of Cell which indicates that Pacman cannot enter this Cell
@@ -236,3 +334,52 @@ class WallCell(Cell):
     def __init__(self, x, y):
         super(WallCell, self).__init__(x, y)
 
+
+# Pacman's stochastic motion model over the WalkableCells of a layout: for each action (up, right, down, left),
+# the probability of ending up in each cell, stored as one CSR sparse matrix of 4 * cells rows.
+# Row action * cells + i holds the (straight, left, right) outcomes of trying that action from cell i; a wall
+# bounce points back at cell i, and duplicate columns are summed like in any CSR matrix
+class TransitionModel(object):
+    def __init__(self, neighbours):
+        north, east, south, west = neighbours
+        # (straight, left, right) neighbour lists for each action, as in Config's motion model
+        outcomes = [(north, west, east), (east, north, south), (south, east, west), (west, south, north)]
+        probabilities = [Config.possibility_straight, Config.possibility_left, Config.possibility_right]
+        self.cells = len(north)
+        indices = []
+        for (straight, left, right) in outcomes:
+            for i in range(self.cells):
+                indices.extend((straight[i], left[i], right[i]))
+        self.indices = numpy.array(indices, dtype=numpy.intp)
+        self.data = numpy.tile(numpy.array(probabilities), 4 * self.cells)
+        self.indptr = numpy.arange(0, len(indices) + 1, 3, dtype=numpy.intp)
+
+    # Builds the model for a wall layout, or reuses the one built for the same walls before (e.g. by an earlier game)
+    @staticmethod
+    def forWalls(wallGrid, neighbours):
+        key = (str(wallGrid), Config.possibility_straight, Config.possibility_left, Config.possibility_right)
+        if key not in TRANSITION_MODEL_CACHE:
+            TRANSITION_MODEL_CACHE[key] = TransitionModel(neighbours)
+        return TRANSITION_MODEL_CACHE[key]
+
+    # Expected utility of trying each action from each cell, as a 4 x cells array: one sparse mat-vec for all actions
+    def expectedUtilities(self, utilities):
+        products = self.data * utilities[self.indices]
+        return numpy.add.reduceat(products, self.indptr[:-1]).reshape(4, self.cells)
+
+    # The (column indices, probabilities) of the rows a policy (an action index per cell) selects, as two cells x 3 arrays
+    def policyRows(self, policy):
+        rows = policy * self.cells + numpy.arange(self.cells)
+        return self.indices.reshape(-1, 3)[rows], self.data.reshape(-1, 3)[rows]
+
+    # Expected utility of following a policy from each cell
+    def policyExpectedUtilities(self, policy, utilities):
+        (columns, probabilities) = self.policyRows(policy)
+        return (probabilities * utilities[columns]).sum(axis=1)
+
+    # Dense cells x cells transition matrix of a policy
+    def policyMatrix(self, policy):
+        (columns, probabilities) = self.policyRows(policy)
+        matrix = numpy.zeros((self.cells, self.cells))
+        numpy.add.at(matrix, (numpy.repeat(numpy.arange(self.cells), 3), columns.ravel()), probabilities.ravel())
+        return matrix
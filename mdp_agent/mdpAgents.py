@@ -34,97 +34,241 @@ import random
 import game
 import util
 from map import PacmanMap, WalkableCell, WallCell, Cell, Config
+import solvers
+import profiling
 
 
 # Pacman agent that wins games using MDP solver
 class MDPAgent(Agent):
 
     # Constructor: this gets run when we first invoke pacman.py
-    def __init__(self):
+    # "-a profile=1" times every tick and prints a summary after every game (see profiling.py),
+    # "-a profile=1,trace=<file>" also appends one JSON line per tick to the file
+    def __init__(self, profile=0, trace=None):
+        if int(profile) or trace is not None:
+            self.profiler = profiling.TickProfiler(trace)
+        else:
+            self.profiler = profiling.NullProfiler()
         self.map = None
+        self.solver = None
+        self.sweeper = None
+        # Reward of every WalkableCell for the current tick, in index order (see getRewards)
+        self.rewards = None
+        # Number of value iteration sweeps run on each tick of the current game
+        self.sweeps_per_tick = []
+        # Largest utility change in the last sweep of each tick of the current game (see getResidual)
+        self.residuals_per_tick = []
+        # The same for the last run of the value iteration in this class, when no solver object is used
+        self.residual = None
+        # Number of cell backups prioritized sweeping needed on each tick of the current game
+        self.backups_per_tick = []
 
     # Gets run after an MDPAgent object is created and once there is
     # game state to access.
     def registerInitialState(self, state):
         if self.map is None:
+            self.checkConfig()
             self.map = PacmanMap(state)
+            if Config.solver in ("pi", "mpi"):
+                if not solvers._NUMPY_ENABLED:
+                    raise Exception("Config.solver = \"" + Config.solver + "\" needs NumPy")
+                self.solver = solvers.PolicyIteration(self.map)
+            elif Config.vectorised_value_iteration and solvers._NUMPY_ENABLED:
+                self.solver = solvers.VectorisedValueIteration(self.map)
+            if Config.prioritized_sweeping:
+                self.sweeper = solvers.PrioritizedSweeping(self.map)
+            elif Config.gauss_seidel:
+                self.sweeper = solvers.GaussSeidelValueIteration(self.map)
+        self.sweeps_per_tick = []
+        self.residuals_per_tick = []
+        self.backups_per_tick = []
         
+    # Raises a ValueError when Config selects more than one solver, as getAction would silently run only one of them,
+    # or names a solver or sweep order that does not exist
+    def checkConfig(self):
+        if Config.solver not in ("vi", "pi", "mpi"):
+            raise ValueError("Unknown Config.solver: \"" + str(Config.solver) + "\"")
+        if Config.prioritized_sweeping and Config.gauss_seidel:
+            raise ValueError("Config.prioritized_sweeping and Config.gauss_seidel cannot both be set")
+        if Config.solver != "vi":
+            for flag in ("prioritized_sweeping", "gauss_seidel"):
+                if getattr(Config, flag):
+                    raise ValueError("Config." + flag + " runs value iteration, it cannot be set with Config.solver = \""
+                                     + Config.solver + "\"")
+        if Config.sweep_order not in ("row", "alternating", "bfs"):
+            raise ValueError("Unknown Config.sweep_order: \"" + str(Config.sweep_order) + "\"")
+
     # This is what gets run in between multiple games
     def final(self, state):
         print("Looks like the game just ended!")
+        for line in self.profiler.endGame():
+            print(line)
+        if self.sweeps_per_tick:
+            print("Sweeps per tick: mean %.1f, max %d over %d ticks" % (
+                sum(self.sweeps_per_tick) / float(len(self.sweeps_per_tick)), max(self.sweeps_per_tick), len(self.sweeps_per_tick)))
+        if self.residuals_per_tick:
+            print("Residual per tick: mean %.4g, max %.4g" % (
+                sum(self.residuals_per_tick) / len(self.residuals_per_tick), max(self.residuals_per_tick)))
+        if Config.prioritized_sweeping and self.backups_per_tick:
+            print("Prioritized sweeping backups per tick: mean %.1f, max %d over %d ticks (%d walkable cells)" % (
+                sum(self.backups_per_tick) / float(len(self.backups_per_tick)), max(self.backups_per_tick),
+                len(self.backups_per_tick), len(self.map.positions)))
 
     # Run at every tick of the game
     # Updates the map representation according to the newest state
     # Runs ValueIteration to calculate the utility value of each state
     # Chooses the action to take according to the optimalPolicy
     def getAction(self, state):
-        self.map.update(state)
+        profiler = self.profiler
+        profiler.startTick()
+        with profiler.phase("update"):
+            self.map.update(state)
         legal = api.legalActions(state)
         my_coordinates = api.whereAmI(state)
+        # Rewards only change between ticks, so all the sweeps of this tick read them from here
+        with profiler.phase("rewards"):
+            self.rewards = self.getRewards()
         # self.map.printMap(my_coordinates)
         # Run the algorithm specified in the Config class "run_until_until_convergence"
-        if(Config.run_until_until_convergence):
-            self.runValueIterationUntilConvergence()
-        else:
-            self.runValueIterationForLimitedCycles()
+        # With "warm_start" the utilities of the previous tick are kept and iterated until they converge again
+        # With "prioritized_sweeping" only the cells affected by what changed since the previous tick are backed up
+        # With "gauss_seidel" the sweeps update the utilities in place, in the order given by "sweep_order"
+        with profiler.phase("solve"):
+            if Config.prioritized_sweeping:
+                self.backups_per_tick.append(self.runPrioritizedSweeping())
+            elif Config.gauss_seidel:
+                self.sweeps_per_tick.append(self.runGaussSeidelValueIteration(my_coordinates))
+            elif self.solver is not None:
+                self.sweeps_per_tick.append(self.runVectorisedValueIteration())
+            elif(Config.run_until_until_convergence or Config.warm_start):
+                self.sweeps_per_tick.append(self.runValueIterationUntilConvergence())
+            else:
+                self.sweeps_per_tick.append(self.runValueIterationForLimitedCycles())
+            self.residuals_per_tick.append(self.getResidual())
             
         # self.map.printUtilities(my_coordinates)
-        self.removeStop(legal)
-        best_move = self.getOptimalPolicy(my_coordinates, legal)
-        self.map.overrideUtilities()
+        with profiler.phase("policy"):
+            self.removeStop(legal)
+            best_move = self.getOptimalPolicy(my_coordinates, legal)
+            if not (Config.warm_start or Config.prioritized_sweeping):
+                self.map.overrideUtilities()
+        if profiler.enabled:
+            self.countWork()
+        profiler.endTick()
         
         return api.makeMove(best_move, legal)
     
+    # Passes the amount of work done on this tick to the profiler: sweeps (or backups for prioritized sweeping),
+    # cells updated and the largest utility change of the last sweep, when the solver measured it
+    def countWork(self):
+        cells = len(self.map.positions)
+        if Config.prioritized_sweeping:
+            self.profiler.count("backups", self.backups_per_tick[-1])
+            self.profiler.count("cells_updated", self.backups_per_tick[-1])
+        else:
+            self.profiler.count("sweeps", self.sweeps_per_tick[-1])
+            self.profiler.count("cells_updated", self.sweeps_per_tick[-1] * cells)
+        self.profiler.count("max_residual", self.residuals_per_tick[-1])
+
+    # Residual of the solver that ran this tick: the largest utility change in its last sweep
+    # (a Bellman sweep of the final utilities for policy iteration, any backup for prioritized sweeping)
+    def getResidual(self):
+        if self.sweeper is not None:
+            return self.sweeper.residual
+        elif self.solver is not None:
+            return self.solver.residual
+        return self.residual
+
     # Value Iteration algorithm that runs for a limited amount of iterations and updates the utility values of all WalkableCells in the map
+    # Returns the number of sweeps that were run
     def runValueIterationForLimitedCycles(self):
+        previous_utilities = self.map.utilities.tolist()
         for i in range(Config.number_of_iterations):
             new_utilities = self.getNewUtilities()
+            if i == Config.number_of_iterations - 1:
+                self.residual = self.getLargestChange(previous_utilities, new_utilities)
+            previous_utilities = new_utilities
             # Set new utilities for each WalkableCell
-            for (coordinates, new_utility) in new_utilities:
-                self.map.getCell(coordinates).utility = new_utility
+            self.map.setUtilities(new_utilities)
+        return Config.number_of_iterations
     
     # Value Iteration algorithm that runs until all utilities converge and updates the utility values of all WalkableCells in the map            
+    # When warm starting, the first sweep is already compared against the utilities left over from the previous tick
+    # Returns the number of sweeps that were run
     def runValueIterationUntilConvergence(self):
         previous_utilities = None
+        if Config.warm_start:
+            previous_utilities = self.map.utilities.tolist()
+        sweeps = 0
         run = True
         while(run):
             new_utilities = self.getNewUtilities()
-            run = self.stillRunValueIteration(previous_utilities, new_utilities)
+            sweeps += 1
+            self.residual = self.getLargestChange(previous_utilities, new_utilities)
+            run = self.residual > Config.convergence_difference
             previous_utilities = new_utilities
             # Set new utilities for each WalkableCell
-            for (coordinates, new_utility) in new_utilities:
-                self.map.getCell(coordinates).utility = new_utility
+            self.map.setUtilities(new_utilities)
+        return sweeps
     
-    # Returns a list of (coordinates, new_utility_value) pairs containing all the walkable cells of the map            
+    # Value Iteration (or policy iteration, see Config.solver) on flat arrays of WalkableCells; the resulting utilities
+    # are written back to the map
+    # Returns the number of sweeps that were run (policy improvement steps for policy iteration)
+    def runVectorisedValueIteration(self):
+        rewards = solvers.numpy.array(self.rewards)
+        initial_utilities = self.solver.utilities if Config.warm_start else None
+        if Config.solver == "pi":
+            utilities = self.solver.runPolicyIteration(rewards, initial_utilities)
+        elif Config.solver == "mpi":
+            utilities = self.solver.runModifiedPolicyIteration(rewards, initial_utilities)
+        elif Config.warm_start:
+            utilities = self.solver.runUntilConvergence(rewards, self.solver.utilities)
+        elif(Config.run_until_until_convergence):
+            utilities = self.solver.runUntilConvergence(rewards)
+        else:
+            utilities = self.solver.runForLimitedCycles(rewards)
+        self.map.setUtilities(utilities.tolist())
+        return self.solver.sweeps
+
+    # Prioritized sweeping seeded with the cells whose reward changed (all of them on the first tick)
+    # Returns the number of cell backups that were run
+    def runPrioritizedSweeping(self):
+        if self.sweeper.rewards is None:
+            changed = range(len(self.map.positions))
+        else:
+            changed = self.map.changedCells
+        rewards = dict((index, self.rewards[index]) for index in changed)
+        self.map.setUtilities(self.sweeper.run(rewards))
+        return self.sweeper.updates
+
+    # Gauss-Seidel Value Iteration on flat lists of WalkableCells; the resulting utilities are written back to the map
+    # Returns the number of sweeps that were run
+    def runGaussSeidelValueIteration(self, my_coordinates):
+        utilities = self.sweeper.run(self.rewards, self.map.indexOf(my_coordinates))
+        self.map.setUtilities(utilities)
+        return self.sweeper.sweeps
+
+    # Returns a list with the new utility value of every WalkableCell, in index order
     def getNewUtilities(self):
-        height = self.map.height
-        width = self.map.width
-        new_utilities = []
-        for y in range(height):
-            for x in range(width):
-                coordinates = (x, y)
-                if isinstance(self.map.getCell(coordinates), WalkableCell):
-                    new_utility = self.getUtility(coordinates)
-                    new_utilities.append((coordinates, new_utility))
-        return new_utilities
+        return [self.getUtility(index) for index in range(len(self.map.positions))]
     
     # Used in value iteration algorithm that runs until all the values converge
-    # Checks if the difference between previous utility value and current utility value of each
-    # state is smalled than the difference needed to stop the algorithm            
-    def stillRunValueIteration(self, previous_utilities, new_utilities):
-        if(previous_utilities is None): return True
-        for x in range(len(previous_utilities)):
-            if abs(previous_utilities[x][1] - new_utilities[x][1]) > Config.convergence_difference:
-                return True
-        return False
+    # Returns the largest difference between the previous and current utility value of a state,
+    # which has to fall below Config.convergence_difference to stop the algorithm
+    # There is no previous value before the first sweep of a cold start, so the difference is then infinite
+    def getLargestChange(self, previous_utilities, new_utilities):
+        if(previous_utilities is None): return float("inf")
+        return max(abs(previous - new) for (previous, new) in zip(previous_utilities, new_utilities))
             
     # Returns a list with utility values of neighbouring cells (up, right, down, left)        
-    def getUtilitiesOfNeighbouringCells(self, coordinates):
-        current_utility = self.map.getCell(coordinates).utility
-        north_utility = self.checkUtility(self.map.topCell(coordinates), current_utility)
-        south_utility = self.checkUtility(self.map.bottomCell(coordinates), current_utility)
-        west_utility = self.checkUtility(self.map.leftCell(coordinates), current_utility)
-        east_utility = self.checkUtility(self.map.rightCell(coordinates), current_utility)
+    # A neighbouring wall has the index of the cell itself, so bouncing off it keeps the current utility
+    def getUtilitiesOfNeighbouringCells(self, index):
+        utilities = self.map.utilities
+        (north, east, south, west) = self.map.neighbours
+        north_utility = utilities[north[index]]
+        south_utility = utilities[south[index]]
+        west_utility = utilities[west[index]]
+        east_utility = utilities[east[index]]
 
         utility_up = Config.possibility_straight * north_utility + Config.possibility_left * west_utility + Config.possibility_right * east_utility
         utility_right = Config.possibility_straight * east_utility + Config.possibility_left * north_utility + Config.possibility_right * south_utility
@@ -134,16 +278,15 @@ class MDPAgent(Agent):
         return [utility_up, utility_right, utility_down, utility_left]
     
     # Bellman's equation calculating the utility value of the state using utilities of its neighbours 
-    def getUtility(self, coordinates):
-        current_cell = self.map.getCell(coordinates)
-        reward = self.getReward(current_cell)
+    def getUtility(self, index):
+        reward = self.rewards[index]
         # Neighbour utilities
-        utilities = self.getUtilitiesOfNeighbouringCells(coordinates)
+        utilities = self.getUtilitiesOfNeighbouringCells(index)
         return reward + (Config.discount_factor * max((utilities[0], utilities[1], utilities[2], utilities[3])))
 
     # Having all the utilities of the neighbours, calculates which way is best (which way has the biggest utility)
     def getOptimalPolicy(self, coordinates, legal):
-        utilities = self.getUtilitiesOfNeighbouringCells(coordinates)
+        utilities = self.getUtilitiesOfNeighbouringCells(self.map.indexOf(coordinates))
         actions_and_utilities = []
         
         for action in legal:
@@ -158,30 +301,17 @@ class MDPAgent(Agent):
 
         return max(actions_and_utilities, key = lambda i : i[1])[0]
 
-    # According to the state of the Cell, return a reward
-    def getReward(self, cell):
-        if isinstance(cell, WallCell):
-            return Config.reward_wall
-        else:
-            if cell.hasGhost:
-                return Config.reward_ghost
-            elif self.map.hasGhostClose((cell.x, cell.y)):
-                return Config.reward_ghost_neighbour_first
-            # elif self.map.neighbourHasGhostClose((cell.x, cell.y)):
-            #     return Config.reward_ghost_neighbour_second
-            elif cell.hasCapsule:
-                return Config.reward_capsule
-            elif cell.hasFood:
-                return Config.reward_food
-            else:
-                return Config.reward_empty
-
-    # If the provided cell is not WallCell, returns its utility
-    def checkUtility(self, cell, default_utility):
-        if isinstance(cell, WallCell):
-            return default_utility
-        else:
-            return cell.utility
+    # Returns a list with the reward of every WalkableCell, in index order
+    # Only the cells near a ghost need a look at the ghost distances, the rest get their reward from food and capsules
+    def getRewards(self):
+        food = self.map.food
+        capsules = self.map.capsules
+        rewards = [Config.reward_capsule if capsules[index] else Config.reward_food if food[index] else Config.reward_empty
+                   for index in range(len(self.map.positions))]
+        ghost_distances = self.map.ghostDistances
+        for index in self.map.cellsNearGhosts:
+            rewards[index] = self.map.ghostDistanceRewards[ghost_distances[index]]
+        return rewards
 
     # Removes Directions.STOP from the list of actions
     def removeStop(self, actions):
@@ -0,0 +1,142 @@
+# Per-tick timing of MDPAgent.getAction, switched on with the agent arguments:
+#
+#   python pacman.py -p MDPAgent -a profile=1
+#   python pacman.py -p MDPAgent -a profile=1,trace=ticks.jsonl
+#
+# Every tick is split into phases that are timed with "with profiler.phase(name):"
+# and can carry counters (sweeps, cells updated, max residual). At the end of every
+# game a summary of the tick latencies and counters is printed and, if a trace file
+# is given, one JSON object per tick is appended to it.
+#
+# When profiling is off the agent uses a NullProfiler, whose methods do nothing.
+
+import json
+import time
+
+# Highest resolution clock available (time.perf_counter does not exist in Python 2)
+clock = getattr(time, "perf_counter", time.time)
+
+
+# Context manager that does nothing, shared by all the phases of the NullProfiler
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+# Profiler used when profiling is off
+class NullProfiler(object):
+    enabled = False
+
+    def startTick(self):
+        pass
+
+    def phase(self, name):
+        return NULL_TIMER
+
+    def count(self, name, value):
+        pass
+
+    def endTick(self):
+        pass
+
+    def endGame(self):
+        return []
+
+
+# Adds the time spent inside the "with" block to the phase with the given name
+class PhaseTimer(object):
+    def __init__(self, phases, name):
+        self.phases = phases
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.phases[self.name] = self.phases.get(self.name, 0.0) + clock() - self.start
+        return False
+
+
+# Nearest-rank percentile of an already sorted list
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    rank = int(round(fraction * (len(values) - 1)))
+    return values[rank]
+
+
+# Collects the phase times and counters of every tick of a game
+class TickProfiler(object):
+    enabled = True
+
+    def __init__(self, trace=None):
+        # Path of the JSON-lines trace, None to only print the summaries
+        self.trace = trace
+        self.trace_file = None
+        self.game = 0
+        self.tick_start = 0.0
+        # Seconds spent in each phase and the counters of the current tick
+        self.phases = {}
+        self.counters = {}
+        # Latency of each tick and total seconds spent in each phase over the current game
+        self.latencies = []
+        self.phase_totals = {}
+        # Values of each counter over the ticks of the current game
+        self.counter_values = {}
+
+    def startTick(self):
+        self.phases = {}
+        self.counters = {}
+        self.tick_start = clock()
+
+    def phase(self, name):
+        return PhaseTimer(self.phases, name)
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def endTick(self):
+        latency = clock() - self.tick_start
+        self.latencies.append(latency)
+        for (name, seconds) in self.phases.items():
+            self.phase_totals[name] = self.phase_totals.get(name, 0.0) + seconds
+        for (name, value) in self.counters.items():
+            if value is not None:
+                self.counter_values.setdefault(name, []).append(value)
+        if self.trace is not None:
+            if self.trace_file is None:
+                self.trace_file = open(self.trace, "a")
+            record = {"game": self.game, "tick": len(self.latencies) - 1, "ms": 1000 * latency,
+                      "phases": dict((name, 1000 * seconds) for (name, seconds) in self.phases.items())}
+            record.update(self.counters)
+            self.trace_file.write(json.dumps(record, sort_keys=True) + "\n")
+
+    # Returns the lines of the summary of the game that just ended and starts counting the next one
+    def endGame(self):
+        lines = []
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            lines.append("Tick latency: p50 %.2f ms, p95 %.2f ms, max %.2f ms over %d ticks" % (
+                1000 * percentile(latencies, 0.5), 1000 * percentile(latencies, 0.95), 1000 * latencies[-1],
+                len(latencies)))
+            lines.append("Mean ms per tick by phase: " + ", ".join(
+                "%s %.2f" % (name, 1000 * self.phase_totals[name] / len(latencies)) for name in sorted(self.phase_totals)))
+        for name in sorted(self.counter_values):
+            values = self.counter_values[name]
+            lines.append("%s per tick: mean %.4g, max %.4g over %d ticks" % (
+                name, sum(values) / float(len(values)), max(values), len(values)))
+        if self.trace_file is not None:
+            self.trace_file.flush()
+        self.latencies = []
+        self.phase_totals = {}
+        self.counter_values = {}
+        self.game += 1
+        return lines
@@ -0,0 +1,265 @@
+# Value iteration engines that work on the flat cell indices of a PacmanMap
+# instead of walking the grid of Cell objects.
+
+import heapq
+
+from map import Config
+
+try:
+    import numpy
+    _NUMPY_ENABLED = True
+except ImportError:
+    _NUMPY_ENABLED = False
+
+
+# Runs Bellman sweeps over all the WalkableCells at once. Utilities and rewards are
+# arrays indexed by the PacmanMap cell index, so one sweep is a sparse mat-vec with the map's
+# TransitionModel followed by a max over the actions
+class VectorisedValueIteration(object):
+    def __init__(self, pacmanMap):
+        self.model = pacmanMap.transitionModel
+        self.utilities = numpy.zeros(len(pacmanMap.positions))
+        # Number of sweeps the last run needed
+        self.sweeps = 0
+        # Largest utility change in the last sweep of the last run (for policy iteration, in a Bellman sweep
+        # of the final utilities)
+        self.residual = None
+
+    # One synchronous Bellman update of every WalkableCell
+    def sweep(self, rewards, utilities):
+        return rewards + Config.discount_factor * self.model.expectedUtilities(utilities).max(axis=0)
+
+    # Value iteration that runs Config.number_of_iterations sweeps starting from all-zero utilities
+    def runForLimitedCycles(self, rewards):
+        utilities = numpy.zeros(len(rewards))
+        previous_utilities = utilities
+        for i in range(Config.number_of_iterations):
+            previous_utilities = utilities
+            utilities = self.sweep(rewards, utilities)
+        self.utilities = utilities
+        self.sweeps = Config.number_of_iterations
+        self.residual = float(numpy.abs(utilities - previous_utilities).max())
+        return utilities
+
+    # Value iteration that runs until no utility changes by more than Config.convergence_difference in a sweep
+    # Starts from all-zero utilities unless initial utilities (e.g. the previous tick's) are given
+    def runUntilConvergence(self, rewards, utilities=None):
+        if utilities is None:
+            utilities = numpy.zeros(len(rewards))
+        sweeps = 0
+        converged = False
+        while not converged:
+            new_utilities = self.sweep(rewards, utilities)
+            sweeps += 1
+            residual = numpy.abs(new_utilities - utilities).max()
+            converged = residual <= Config.convergence_difference
+            utilities = new_utilities
+        self.utilities = utilities
+        self.sweeps = sweeps
+        self.residual = float(residual)
+        return utilities
+
+
+# Policy iteration over the same flat arrays. A policy is an action index (up, right, down, left) per cell
+class PolicyIteration(VectorisedValueIteration):
+
+    # Greedy policy for the given utilities. Cells keep their current action unless another one is strictly better,
+    # so that ties cannot make the policy flip back and forth forever
+    def improvePolicy(self, utilities, policy=None):
+        expected = self.model.expectedUtilities(utilities)
+        best = expected.argmax(axis=0)
+        if policy is not None:
+            cells = numpy.arange(len(utilities))
+            keep = expected[policy, cells] >= expected[best, cells] - 1e-9
+            best[keep] = policy[keep]
+        return best
+
+    # Exact policy evaluation: solves (I - discount * P) U = R for the policy's transition matrix P
+    def evaluatePolicy(self, rewards, policy):
+        matrix = numpy.identity(len(rewards)) - Config.discount_factor * self.model.policyMatrix(policy)
+        return numpy.linalg.solve(matrix, rewards)
+
+    # Policy iteration: evaluates the policy exactly and improves it until it stops changing
+    # The first policy is greedy with respect to the given utilities (all zero unless warm starting)
+    def runPolicyIteration(self, rewards, utilities=None):
+        if utilities is None:
+            utilities = numpy.zeros(len(rewards))
+        policy = self.improvePolicy(utilities)
+        steps = 0
+        while True:
+            utilities = self.evaluatePolicy(rewards, policy)
+            steps += 1
+            new_policy = self.improvePolicy(utilities, policy)
+            if numpy.array_equal(new_policy, policy):
+                break
+            policy = new_policy
+        self.utilities = utilities
+        self.sweeps = steps
+        # The utilities are exact for the final policy, so this is about 0 unless the linear solve lost precision
+        self.residual = float(numpy.abs(self.sweep(rewards, utilities) - utilities).max())
+        return utilities
+
+    # Modified policy iteration: a Bellman sweep picks the greedy policy, which is then evaluated with
+    # Config.policy_evaluation_sweeps cheap sweeps, until a Bellman sweep changes no utility by more than
+    # Config.convergence_difference
+    def runModifiedPolicyIteration(self, rewards, utilities=None):
+        if utilities is None:
+            utilities = numpy.zeros(len(rewards))
+        sweeps = 0
+        while True:
+            expected = self.model.expectedUtilities(utilities)
+            policy = expected.argmax(axis=0)
+            new_utilities = rewards + Config.discount_factor * expected.max(axis=0)
+            sweeps += 1
+            residual = numpy.abs(new_utilities - utilities).max()
+            converged = residual <= Config.convergence_difference
+            utilities = new_utilities
+            if converged:
+                break
+            for i in range(Config.policy_evaluation_sweeps):
+                utilities = rewards + Config.discount_factor * self.model.policyExpectedUtilities(policy, utilities)
+            sweeps += Config.policy_evaluation_sweeps
+        self.utilities = utilities
+        self.sweeps = sweeps
+        self.residual = float(residual)
+        return utilities
+
+
+# Base for the solvers that back up one cell at a time. These work on plain lists,
+# as every backup reads and writes single cells
+class CellBackups(object):
+    def __init__(self, pacmanMap):
+        self.north, self.east, self.south, self.west = pacmanMap.neighbours
+        self.utilities = [0.0] * len(pacmanMap.positions)
+        self.rewards = None
+        # Largest utility change of the last run (in its last sweep for the solvers that sweep)
+        self.residual = None
+
+    # Bellman's equation for a single cell
+    def backup(self, index):
+        utilities = self.utilities
+        north = utilities[self.north[index]]
+        east = utilities[self.east[index]]
+        south = utilities[self.south[index]]
+        west = utilities[self.west[index]]
+        return self.rewards[index] + Config.discount_factor * max(
+            Config.possibility_straight * north + Config.possibility_left * west + Config.possibility_right * east,
+            Config.possibility_straight * east + Config.possibility_left * north + Config.possibility_right * south,
+            Config.possibility_straight * south + Config.possibility_left * east + Config.possibility_right * west,
+            Config.possibility_straight * west + Config.possibility_left * south + Config.possibility_right * north)
+
+
+# Gauss-Seidel value iteration: every backup is written in place, so later cells in the same sweep already
+# see it and values travel along a corridor within one sweep instead of one cell per sweep.
+# The cells are visited in the order given by Config.sweep_order
+class GaussSeidelValueIteration(CellBackups):
+    def __init__(self, pacmanMap):
+        super(GaussSeidelValueIteration, self).__init__(pacmanMap)
+        # Number of sweeps the last run needed
+        self.sweeps = 0
+
+    # Order in which the cells are visited in a sweep
+    # "row": row by row from the bottom, "alternating": the same but reversed on every other sweep,
+    # "bfs": breadth first outwards from Pacman's cell (cells Pacman cannot reach come last)
+    def sweepOrder(self, pacmanIndex):
+        if Config.sweep_order != "bfs":
+            return list(range(len(self.utilities)))
+        order = [pacmanIndex]
+        visited = set(order)
+        for index in order:
+            for neighbours in (self.north, self.east, self.south, self.west):
+                neighbour = neighbours[index]
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    order.append(neighbour)
+        order.extend(index for index in range(len(self.utilities)) if index not in visited)
+        return order
+
+    # Runs in-place sweeps with the given rewards (a list indexed by cell). Starts from all-zero utilities unless
+    # warm starting and, like the other solvers, runs until convergence or Config.number_of_iterations sweeps
+    def run(self, rewards, pacmanIndex):
+        self.rewards = rewards
+        if not Config.warm_start:
+            self.utilities = [0.0] * len(rewards)
+        utilities = self.utilities
+        until_convergence = Config.run_until_until_convergence or Config.warm_start
+        order = self.sweepOrder(pacmanIndex)
+        reverse_order = order[::-1]
+        sweeps = 0
+        while True:
+            if Config.sweep_order == "alternating" and sweeps % 2 == 1:
+                cells = reverse_order
+            else:
+                cells = order
+            largest_change = 0.0
+            for index in cells:
+                utility = self.backup(index)
+                change = abs(utility - utilities[index])
+                if change > largest_change:
+                    largest_change = change
+                utilities[index] = utility
+            sweeps += 1
+            if until_convergence:
+                if largest_change <= Config.convergence_difference:
+                    break
+            elif sweeps == Config.number_of_iterations:
+                break
+        self.sweeps = sweeps
+        self.residual = largest_change
+        return utilities
+
+
+# Prioritized sweeping over the WalkableCells. The utilities are kept from tick to tick and only the cells
+# whose reward changed (see PacmanMap.changedCells) are backed up first; their predecessors are then queued
+# by Bellman residual, so cells far away from anything that changed are never touched
+class PrioritizedSweeping(CellBackups):
+    def __init__(self, pacmanMap):
+        super(PrioritizedSweeping, self).__init__(pacmanMap)
+        count = len(self.utilities)
+        # Cells that can end up in a given cell after a single move: its walkable neighbours and,
+        # if it bounces off a wall, the cell itself
+        self.predecessors = [set() for i in range(count)]
+        for neighbours in pacmanMap.neighbours:
+            for (index, neighbour) in enumerate(neighbours):
+                self.predecessors[neighbour].add(index)
+        self.predecessors = [sorted(predecessors) for predecessors in self.predecessors]
+        # Number of cell backups the last run needed
+        self.updates = 0
+
+    # Sets the rewards of the given cells and backs up the utilities until every queued residual falls
+    # below Config.prioritized_sweeping_threshold. rewards maps cell index to reward; the first run needs all of them
+    def run(self, rewards):
+        if self.rewards is None:
+            self.rewards = [0.0] * len(self.utilities)
+        for (index, reward) in rewards.items():
+            self.rewards[index] = reward
+
+        threshold = Config.prioritized_sweeping_threshold
+        queue = []
+        priorities = {}
+        for index in rewards:
+            self.push(queue, priorities, index, abs(self.backup(index) - self.utilities[index]), threshold)
+
+        updates = 0
+        largest_residual = 0.0
+        while queue:
+            (priority, index) = heapq.heappop(queue)
+            # Skip entries that were superseded by a higher priority
+            if priorities.get(index) != -priority:
+                continue
+            del priorities[index]
+            largest_residual = max(largest_residual, -priority)
+            self.utilities[index] = self.backup(index)
+            updates += 1
+            for predecessor in self.predecessors[index]:
+                residual = abs(self.backup(predecessor) - self.utilities[predecessor])
+                self.push(queue, priorities, predecessor, residual, threshold)
+        self.updates = updates
+        self.residual = largest_residual
+        return self.utilities
+
+    # Queues a cell if its residual is above the threshold and above the priority it is already queued with
+    def push(self, queue, priorities, index, residual, threshold):
+        if residual > threshold and residual > priorities.get(index, 0.0):
+            priorities[index] = residual
+            heapq.heappush(queue, (-residual, index))
@@ -0,0 +1,359 @@
+# benchmark.py
+#
+# Compares the Q-table backends of QLearnAgent (see qtables.py).
+#
+# For each backend a fresh agent is trained on the same layout with the same
+# seed, and the training episodes per second are reported. The Q-learning
+# updates of the sparse run are also recorded and replayed on an empty table of
+# each backend, which times the table operations on their own and measures the
+# memory the table ends up using.
+#
+# With --runner it instead compares the headless training runner of pacman.py
+# (runTrainingEpisode) with Game.run: the same seeded episodes are played with
+# both, which must give the same scores and the same Q-table, and the episodes
+# per second of each are reported.
+#
+# With --check it instead runs quick checks of the learning code, and fails if
+# one of them does not hold:
+#  - 20 seeded smallGrid episodes give the same scores and Q-table with the
+#    headless runner and with Game.run.
+#  - a replay batch in which transitions are repeated teaches the same to the
+#    sparse and the dense Q-tables, each state and action moving by alpha
+#    however often it was sampled (see QTable.learnBatch).
+#  - merging tables trained in parallel, where one of them learned a key and
+#    the others left it alone, gives that key the value of the one that
+#    learned it, on both Q-tables (see QTable.merge).
+#
+# With --memory it checks that memory stays flat over a long training run: an
+# agent with a bounded Q-table is trained (2000 episodes by default) and the
+# script fails if the resident set size grows by more than --maxGrowth MiB
+# after the first tenth of the episodes.
+#
+# With --successors it times the engine itself: the moves of seeded games
+# with random moves are recorded (300 games by default), and the time per
+# successor spent in GameState.generateSuccessor, in hashing the successor
+# and in copying its AgentStates is reported.
+#
+# Usage:
+#   python3 benchmark.py                         (smallGrid, 300 episodes)
+#   python3 benchmark.py -l mediumGrid -n 1000
+#   python3 benchmark.py --runner -l mediumClassic -n 50
+#   python3 benchmark.py --check
+#   python3 benchmark.py --memory
+#   python3 benchmark.py --successors -l mediumClassic
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import contextlib
+import copy
+import io
+import math
+import os
+import random
+import resource
+import time
+import tracemalloc
+from optparse import OptionParser
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import pacman
+import pacman_utils.layout as layout
+import pacman_utils.textDisplay as textDisplay
+from mlLearningAgents import QLearnAgent
+from pacman_utils.ghostAgents import RandomGhost
+from qtables import DenseQTable, QTable
+
+BACKENDS = ["sparse", "dense"]
+
+
+# Trains a fresh agent for the given number of episodes, returns it and the seconds it took
+def train(gameLayout, backend, episodes, seed, **agentArgs):
+    random.seed(seed)
+    agent = QLearnAgent(numTraining=episodes, qTable=backend, **agentArgs)
+    ghosts = [RandomGhost(i + 1) for i in range(gameLayout.getNumGhosts())]
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pacman.runGames(gameLayout, agent, ghosts, textDisplay.NullGraphics(), episodes, False, numTraining=episodes)
+    return agent, time.time() - start
+
+
+# Plays seeded training episodes with Game.run, or with the headless runner if fast,
+# returns the agent, the score of every episode and the seconds it took
+def playEpisodes(gameLayout, episodes, seed, fast):
+    random.seed(seed)
+    agent = QLearnAgent(numTraining=episodes)
+    ghosts = [RandomGhost(i + 1) for i in range(gameLayout.getNumGhosts())]
+    rules = pacman.ClassicGameRules()
+    rules.quiet = True
+    scores = []
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(episodes):
+            if fast:
+                game = pacman.runTrainingEpisode(rules, gameLayout, agent, ghosts)
+            else:
+                game = rules.newGame(gameLayout, agent, ghosts, textDisplay.NullGraphics(), True)
+                game.run()
+            scores.append(game.state.getScore())
+    return agent, scores, time.time() - start
+
+
+# Plays the same seeded episodes with Game.run and with the headless runner, fails unless they
+# give the same scores and Q-table, returns the seconds each runner took
+def checkRunners(gameLayout, episodes, seed):
+    slowAgent, slowScores, slowSeconds = playEpisodes(gameLayout, episodes, seed, False)
+    fastAgent, fastScores, fastSeconds = playEpisodes(gameLayout, episodes, seed, True)
+    if slowScores != fastScores:
+        first = next(i for i in range(episodes) if slowScores[i] != fastScores[i])
+        raise SystemExit("Scores differ from episode %d: %s with Game.run, %s headless" % (
+            first, slowScores[first], fastScores[first]))
+    if slowAgent.q_table.values != fastAgent.q_table.values or slowAgent.q_table.counts != fastAgent.q_table.counts:
+        raise SystemExit("The Q-tables learned with Game.run and headless differ")
+    print("Same scores and Q-table with Game.run and headless over %d episodes" % episodes)
+    return slowSeconds, fastSeconds
+
+
+def compareRunners(gameLayout, episodes, seed):
+    slowSeconds, fastSeconds = checkRunners(gameLayout, episodes, seed)
+    print("%-10s %12s" % ("runner", "episodes/s"))
+    print("%-10s %12.1f" % ("Game.run", episodes / slowSeconds))
+    print("%-10s %12.1f" % ("headless", episodes / fastSeconds))
+
+
+# Learns a replay batch of a few transitions, each repeated many times, on the sparse and dense
+# tables of a trained agent, and fails unless both end up with the same Q-values
+def checkReplay(gameLayout, seed, alpha=0.2, gamma=0.8):
+    agent, _ = train(gameLayout, "dense", 20, seed)
+    dense = agent.q_table
+    if not isinstance(dense, DenseQTable):
+        print("Replay check skipped: dense Q-table not available")
+        return
+    sparse = dense.toSparse()
+    keys = dict(dense.stateKeys())
+    rows = sorted(keys)
+    generator = random.Random(seed)
+    transitions = [(generator.choice(rows), generator.randrange(len(DenseQTable.MOVES)), generator.uniform(-10, 10),
+                    generator.choice(rows), generator.random() < 0.2) for _ in range(4)]
+    batch = [generator.choice(transitions) for _ in range(32)]
+    states, columns, rewards, nextStates, terminal = zip(*batch)
+    before = dense.values.copy()
+    dense.learnBatch(numpy.array(states), numpy.array(columns), numpy.array(rewards), numpy.array(nextStates),
+                     numpy.array(terminal), alpha, gamma)
+    sparse.learnBatch([keys[state] for state in states], [DenseQTable.MOVES[column] for column in columns], rewards,
+                      [keys[state] for state in nextStates], terminal, alpha, gamma)
+    for row, column, _, _, _ in transitions:
+        key = (keys[row], DenseQTable.MOVES[column])
+        if not math.isclose(dense.values[row, column], sparse.peekValue(key), rel_tol=1e-9, abs_tol=1e-12):
+            raise SystemExit("Replay batch: %r is %r in the dense table and %r in the sparse one" % (
+                key, dense.values[row, column], sparse.peekValue(key)))
+    # A single batch moves each state and action at most alpha of the way to its target
+    largest = numpy.abs(dense.values - before).max()
+    bound = alpha * max(abs(reward) + gamma * numpy.abs(before).max() + numpy.abs(before).max()
+                        for _, _, reward, _, _ in transitions)
+    if largest > bound:
+        raise SystemExit("Replay batch moved a Q-value by %g, more than alpha allows (%g)" % (largest, bound))
+    print("Same Q-values on both tables after a replay batch of %d transitions with repeats" % len(batch))
+
+
+# Merges copies of a trained table where only the first copy learned one more time from a visited key,
+# and fails unless the merged key has that copy's value and visits, on both tables
+def checkMerge(gameLayout, seed):
+    agent, _ = train(gameLayout, "dense", 20, seed)
+    sparse = agent.q_table if isinstance(agent.q_table, QTable) else agent.q_table.toSparse()
+    key = max(sparse.counts, key=sparse.counts.get)
+    for master in {sparse, agent.q_table}:
+        copies = [copy.deepcopy(master) for _ in range(3)]
+        learned = master.getValue(key) + 1.0
+        copies[0].setValue(key, learned)
+        copies[0].incrementCount(key)
+        merged = type(master).merge(master, copies)
+        if merged.getValue(key) != learned or merged.getCount(key) != master.getCount(key) + 1:
+            raise SystemExit("Merge of %s: %r is %r with %d visits, expected %r with %d" % (
+                type(master).__name__, key, merged.getValue(key), merged.getCount(key), learned,
+                master.getCount(key) + 1))
+    print("Merged tables keep the value learned by a single worker")
+
+
+# Resident set size of the process in bytes (the peak one where /proc is not available)
+def residentSetSize():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def checkMemory(gameLayout, episodes, seed, maxGrowth):
+    random.seed(seed)
+    # The Q-table is bounded, so that whatever grows is the engine's
+    agent = QLearnAgent(numTraining=episodes, maxEntries=10000)
+    ghosts = [RandomGhost(i + 1) for i in range(gameLayout.getNumGhosts())]
+    rules = pacman.ClassicGameRules()
+    rules.quiet = True
+    warmup = max(1, episodes // 10)
+    print("%-8s %10s" % ("episode", "RSS MiB"))
+    for i in range(episodes):
+        with contextlib.redirect_stdout(io.StringIO()):
+            pacman.runTrainingEpisode(rules, gameLayout, agent, ghosts)
+        if (i + 1) % warmup == 0:
+            rss = residentSetSize()
+            if i + 1 == warmup:
+                base = rss
+            print("%-8d %10.1f" % (i + 1, rss / 2.0 ** 20))
+    growth = (rss - base) / 2.0 ** 20
+    if growth > maxGrowth:
+        raise SystemExit("RSS grew by %.1f MiB after episode %d, more than %.1f MiB" % (growth, warmup, maxGrowth))
+    print("RSS grew by %.1f MiB after episode %d" % (growth, warmup))
+
+
+# Records the moves of seeded games with random moves, as (state, agent index, action)
+def recordMoves(gameLayout, games, seed):
+    random.seed(seed)
+    moves = []
+    for i in range(games):
+        state = pacman.GameState()
+        state.initialize(gameLayout, gameLayout.getNumGhosts())
+        agentIndex = 0
+        while not (state.isWin() or state.isLose()):
+            action = random.choice(state.getLegalActions(agentIndex))
+            moves.append((state, agentIndex, action))
+            state = state.generateSuccessor(agentIndex, action)
+            agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return moves
+
+
+def timeSuccessors(gameLayout, games, seed):
+    moves = recordMoves(gameLayout, games, seed)
+    start = time.time()
+    successors = [state.generateSuccessor(agentIndex, action) for state, agentIndex, action in moves]
+    generateSeconds = time.time() - start
+    start = time.time()
+    for successor in successors:
+        hash(successor)
+    hashSeconds = time.time() - start
+    start = time.time()
+    for successor in successors:
+        for agentState in successor.data.agentStates:
+            agentState.copy()
+    copySeconds = time.time() - start
+    print("%d successors of %d games" % (len(successors), games))
+    print("%-20s %14s" % ("operation", "us/successor"))
+    print("%-20s %14.2f" % ("generateSuccessor", 1e6 * generateSeconds / len(successors)))
+    print("%-20s %14.2f" % ("hash", 1e6 * hashSeconds / len(successors)))
+    print("%-20s %14.2f" % ("AgentState.copy", 1e6 * copySeconds / len(successors)))
+
+
+# Wraps a Q-table to record the Q-learning updates made to it, as (state key, action, next state key)
+class RecordingTable:
+    def __init__(self, table):
+        self.table = table
+        self.updates = []
+        self.lastMax = None
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    def maxValue(self, stateKey):
+        self.lastMax = stateKey
+        return self.table.maxValue(stateKey)
+
+    def setValue(self, key, value):
+        self.updates.append((key[0], key[1], self.lastMax))
+        self.table.setValue(key, value)
+
+
+# Replays recorded updates on an empty table made by newTable, returns the updates per second
+# and the peak memory in bytes
+def replay(newTable, updates, alpha=0.2, gamma=0.8):
+    table = newTable()
+    start = time.time()
+    applyUpdates(table, updates, alpha, gamma)
+    seconds = time.time() - start
+    # Memory is measured on a second run, as tracing the allocations slows the first one down
+    tracemalloc.start()
+    applyUpdates(newTable(), updates, alpha, gamma)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return len(updates) / seconds, peak
+
+
+def applyUpdates(table, updates, alpha, gamma):
+    for stateKey, action, nextStateKey in updates:
+        key = (stateKey, action)
+        q = table.getValue(key)
+        table.setValue(key, q + alpha * (1.0 + gamma * table.maxValue(nextStateKey) - q))
+        table.incrementCount(key)
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-l', '--layout', dest='layout', default='smallGrid',
+                      help='Layout to train on [Default: %default]')
+    parser.add_option('-n', '--episodes', dest='episodes', type='int', default=None,
+                      help='Number of training episodes per backend or runner, or of games with --successors '
+                           '[Default: 300, 2000 with --memory]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=1,
+                      help='Random seed of the training runs [Default: %default]')
+    parser.add_option('--runner', action='store_true', dest='runner', default=False,
+                      help='Compare the headless training runner with Game.run instead of the backends')
+    parser.add_option('--check', action='store_true', dest='check', default=False,
+                      help='Run quick checks of the learning code instead')
+    parser.add_option('--memory', action='store_true', dest='memory', default=False,
+                      help='Check that memory stays bounded over a long training run instead')
+    parser.add_option('--successors', action='store_true', dest='successors', default=False,
+                      help='Time generating and hashing successor states instead')
+    parser.add_option('--maxGrowth', dest='maxGrowth', type='float', default=1.0,
+                      help='RSS growth in MiB above which --memory fails [Default: %default]')
+    parser.add_option('--explored', dest='explored', type='choice', choices=['count', 'states'], default=None,
+                      help='Track the explored states while checking memory (see pacman.py --explored)')
+    options, otherjunk = parser.parse_args()
+
+    if options.episodes is None:
+        options.episodes = 2000 if options.memory else 300
+
+    gameLayout = layout.getLayout(options.layout)
+    if options.runner:
+        compareRunners(gameLayout, options.episodes, options.seed)
+        raise SystemExit
+    if options.check:
+        checkRunners(layout.getLayout('smallGrid'), 20, options.seed)
+        checkReplay(gameLayout, options.seed)
+        checkMerge(gameLayout, options.seed)
+        raise SystemExit
+    if options.successors:
+        timeSuccessors(gameLayout, options.episodes, options.seed)
+        raise SystemExit
+    if options.memory:
+        pacman.GameState.trackExplored(options.explored)
+        checkMemory(gameLayout, options.episodes, options.seed, options.maxGrowth)
+        raise SystemExit
+    print("%-8s %12s %14s %12s" % ("backend", "episodes/s", "updates/s", "table KiB"))
+    updates = None
+    for backend in BACKENDS:
+        agent, seconds = train(gameLayout, backend, options.episodes, options.seed)
+        if backend == "dense" and not isinstance(agent.q_table, DenseQTable):
+            print("%-8s %s" % (backend, "not available (NumPy missing or too many states)"))
+            continue
+        if updates is None:
+            # Records the updates of a sparse run, to replay them on every backend
+            recorder = QLearnAgent(numTraining=options.episodes, qTable="sparse")
+            random.seed(options.seed)
+            recorder.q_table = RecordingTable(recorder.q_table)
+            ghosts = [RandomGhost(i + 1) for i in range(gameLayout.getNumGhosts())]
+            with contextlib.redirect_stdout(io.StringIO()):
+                pacman.runGames(gameLayout, recorder, ghosts, textDisplay.NullGraphics(), options.episodes, False,
+                                numTraining=options.episodes)
+            updates = recorder.q_table.updates
+        if backend == "dense":
+            initialState = pacman.GameState()
+            initialState.initialize(gameLayout, gameLayout.getNumGhosts())
+            newTable = lambda: DenseQTable.forState(initialState, agent.maxDenseStates)
+        else:
+            newTable = QTable
+        rate, peak = replay(newTable, updates)
+        print("%-8s %12.1f %14.0f %12.1f" % (backend, options.episodes / seconds, rate, peak / 1024.0))
@@ -0,0 +1,131 @@
+# distances.py
+#
+# Maze distances between the walkable cells of a layout.
+#
+# A breadth first search is run once from every walkable cell and the results
+# are kept in a flat array of unsigned 16 bit integers, so looking up the
+# distance between two cells is a single index operation. The distances only
+# depend on the walls, so they are computed once per layout and cached.
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import math
+from array import array
+
+# MazeDistances per layout, keyed by the layout's walls
+DISTANCE_CACHE = {}
+# The walls Grid and distances of the last lookup. All the states of a game share the same walls Grid,
+# so this saves building the cache key on every step
+_lastLookup = (None, None)
+
+
+class MazeDistances:
+    """
+    All-pairs maze distances of a layout
+    """
+
+    # Stored distance between cells that cannot reach each other
+    UNREACHABLE = 0xFFFF
+
+    def __init__(self, walls):
+        """
+        Args:
+            walls: the wall Grid of the layout
+        """
+        self.width = walls.width
+        self.height = walls.height
+        # Index of every walkable cell, the rows and columns of the distance matrix
+        self.cellIndex = {}
+        for x in range(walls.width):
+            for y in range(walls.height):
+                if not walls[x][y]:
+                    self.cellIndex[(x, y)] = len(self.cellIndex)
+        count = len(self.cellIndex)
+        neighbours = [[] for _ in range(count)]
+        for (x, y), index in self.cellIndex.items():
+            for position in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                neighbour = self.cellIndex.get(position)
+                if neighbour is not None:
+                    neighbours[index].append(neighbour)
+
+        self.count = count
+        self.distances = array('H', [MazeDistances.UNREACHABLE]) * (count * count)
+        for source in range(count):
+            self.search(source, neighbours)
+
+    def search(self, source: int, neighbours: list):
+        """
+        Breadth first search that fills in the row of the given cell
+        """
+        distances = self.distances
+        row = source * self.count
+        distances[row + source] = 0
+        frontier = [source]
+        distance = 0
+        while frontier:
+            distance += 1
+            nextFrontier = []
+            for index in frontier:
+                for neighbour in neighbours[index]:
+                    if distances[row + neighbour] == MazeDistances.UNREACHABLE:
+                        distances[row + neighbour] = distance
+                        nextFrontier.append(neighbour)
+            frontier = nextFrontier
+
+    @staticmethod
+    def forWalls(walls) -> "MazeDistances":
+        """
+        Returns the (cached) distances of the layout with the given walls
+        """
+        global _lastLookup
+        if _lastLookup[0] is walls:
+            return _lastLookup[1]
+        key = (walls.width, walls.height, walls.bits)
+        distances = DISTANCE_CACHE.get(key)
+        if distances is None:
+            distances = MazeDistances(walls)
+            DISTANCE_CACHE[key] = distances
+        _lastLookup = (walls, distances)
+        return distances
+
+    def cellDistance(self, a: tuple, b: tuple) -> int:
+        """
+        Maze distance between two walkable cells with integer coordinates,
+        MazeDistances.UNREACHABLE if there is no path between them
+        """
+        return self.distances[self.cellIndex[a] * self.count + self.cellIndex[b]]
+
+    def cellsAround(self, position: tuple) -> list:
+        """
+        The walkable cells an agent at the given position is at or between, with how far
+        it is from each of them. Ghosts move at half speed while they are scared, so they
+        can be halfway between two cells, e.g. at (2.5, 3)
+        """
+        x, y = position
+        cells = []
+        for cellX in {math.floor(x), math.ceil(x)}:
+            for cellY in {math.floor(y), math.ceil(y)}:
+                index = self.cellIndex.get((cellX, cellY))
+                if index is not None:
+                    cells.append((index, abs(x - cellX) + abs(y - cellY)))
+        return cells
+
+    def distance(self, a: tuple, b: tuple) -> float:
+        """
+        Maze distance between two positions, which may lie between two cells.
+        Returns infinity if there is no path between them
+        """
+        indexA = self.cellIndex.get(a)
+        indexB = self.cellIndex.get(b)
+        if indexA is not None and indexB is not None:
+            distance = self.distances[indexA * self.count + indexB]
+            return float("inf") if distance == MazeDistances.UNREACHABLE else distance
+        best = float("inf")
+        for indexA, offsetA in self.cellsAround(a):
+            row = indexA * self.count
+            for indexB, offsetB in self.cellsAround(b):
+                distance = self.distances[row + indexB]
+                if distance != MazeDistances.UNREACHABLE:
+                    best = min(best, distance + offsetA + offsetB)
+        return best
@@ -0,0 +1,117 @@
+# features.py
+#
+# Features of (state, action) pairs for ApproximateQAgent.
+#
+# The Q-value of an action is the dot product of a fixed-size weight vector
+# with the features of the state the action leads to, so the agent learns one
+# weight per feature instead of one value per state and generalises to states
+# and layouts it has never seen. The features of all the legal actions of a
+# state are computed at once, as the rows of one matrix, from the cached maze
+# distances of the layout (see distances.py).
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+from distances import MazeDistances
+from pacman_utils.game import Actions
+
+try:
+    import numpy
+    _NUMPY_ENABLED = True
+except ImportError:
+    _NUMPY_ENABLED = False
+
+
+class FeatureExtractor:
+    """
+    Computes the features of the legal actions of a GameStateFeatures. Every feature is
+    scaled to about [0, 1] and the vector is divided by SCALE, so that one update with a
+    reward of a few hundred points (losing a game) does not make the weights diverge
+    """
+
+    NAMES = ["bias",
+             "closest-food",           # maze distance to the nearest food, over the number of cells
+             "eats-food",              # the move eats a food and no dangerous ghost is next to it
+             "ghosts-1-step-away",     # dangerous ghosts at most one step away
+             "ghost-closeness",        # 1 / (1 + maze distance to the nearest dangerous ghost)
+             "scared-ghost-closeness", # 1 / (1 + maze distance to the nearest scared ghost)
+             "food-left",              # food left after the move, over the number of cells
+             "walls-around"]           # walls around the cell the move leads to, over 4 (0.75 for a dead end)
+    NUM_FEATURES = len(NAMES)
+    SCALE = 10.0
+
+    def __init__(self):
+        # The layout the tables below are for
+        self.walls = None
+
+    def forWalls(self, walls):
+        """
+        Builds the per-layout tables: the maze distances as a matrix indexed by cell,
+        the cell every move leads to and the walls around every cell
+        """
+        distances = MazeDistances.forWalls(walls)
+        self.walls = walls
+        self.cellIndex = distances.cellIndex
+        self.distances = distances
+        count = distances.count
+        self.count = count
+        # A view of the distances, not a copy
+        self.matrix = numpy.frombuffer(distances.distances, dtype=numpy.uint16).reshape(count, count)
+        self.wallsAround = numpy.zeros(count)
+        for (x, y), index in self.cellIndex.items():
+            self.wallsAround[index] = sum(1 for (dx, dy) in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                                          if walls[x + dx][y + dy]) / 4.0
+
+    def actionFeatures(self, state, actions: list):
+        """
+        Args:
+            state: a GameStateFeatures
+            actions: the legal actions to compute the features of
+        Returns:
+            a matrix with a row of NUM_FEATURES features for every action
+        """
+        gameState = state.state
+        walls = gameState.getWalls()
+        if walls is not self.walls:
+            self.forWalls(walls)
+
+        x, y = gameState.getPacmanPosition()
+        cells = []
+        for action in actions:
+            dx, dy = Actions.directionToVector(action)
+            cells.append(self.cellIndex[(int(x + dx), int(y + dy))])
+        cells = numpy.array(cells)
+        # Maze distances from the cell each action leads to, to every cell
+        rows = self.matrix[cells].astype(numpy.float64)
+
+        features = numpy.zeros((len(actions), FeatureExtractor.NUM_FEATURES))
+        features[:, 0] = 1.0
+
+        food = [self.cellIndex[position] for position in gameState.getFood().asList()]
+        eats = numpy.zeros(len(actions))
+        if food:
+            foodDistances = rows[:, food].min(axis=1)
+            features[:, 1] = foodDistances / self.count
+            eats = (foodDistances == 0).astype(numpy.float64)
+
+        # Nearest dangerous and scared ghost. Scared ghosts can be halfway between two cells
+        dangerous = numpy.full(len(actions), numpy.inf)
+        scared = numpy.full(len(actions), numpy.inf)
+        oneStepAway = numpy.zeros(len(actions))
+        for ghost in gameState.getGhostStates():
+            ghostDistances = numpy.full(len(actions), numpy.inf)
+            for index, offset in self.distances.cellsAround(ghost.getPosition()):
+                ghostDistances = numpy.minimum(ghostDistances, rows[:, index] + offset)
+            if ghost.scaredTimer > 0:
+                scared = numpy.minimum(scared, ghostDistances)
+            else:
+                dangerous = numpy.minimum(dangerous, ghostDistances)
+                oneStepAway += ghostDistances <= 1
+
+        features[:, 2] = eats * (oneStepAway == 0)
+        features[:, 3] = oneStepAway
+        features[:, 4] = 1.0 / (1.0 + dangerous)
+        features[:, 5] = 1.0 / (1.0 + scared)
+        features[:, 6] = (len(food) - eats) / self.count
+        features[:, 7] = self.wallsAround[cells]
+        return features / FeatureExtractor.SCALE
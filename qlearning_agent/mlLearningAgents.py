@@ -31,15 +31,29 @@ from __future__ import print_function
 
 import random
 
+try:
+    import numpy
+    _NUMPY_ENABLED = True
+except ImportError:
+    _NUMPY_ENABLED = False
+
 from pacman import Directions, GameState
 from pacman_utils.game import Agent
 from pacman_utils import util
-from queue import PriorityQueue
+from distances import MazeDistances
+from features import FeatureExtractor
+from qtables import DenseQTable, QTable
+from replay import ReplayBuffer
 
 # GameStateFeatures should only contain info about the game i think (the qvalues and visitations should be held in the agent)
-# fix the q values dictionary / ~ ~ maybe combine it with the visitations ~ ~
 #
 
+# A boolean Grid as an integer, bit x * height + y is set if cell (x, y) is True
+# Grids are stored that way (see game.Grid), so this is the Grid's own bits
+def foodBitmask(grid) -> int:
+    return grid.bits
+
+
 class GameStateFeatures:
     """
     Wrapper class around a game state where you can extract
@@ -57,87 +71,66 @@ class GameStateFeatures:
 
         self.state = state
 
+        # Compact key that identifies the state in the Q-table (see stateKey), computed once per state
+        self.key = self.stateKey(state)
+        self.hash = hash(self.key)
+
         # Might come in handy to store information about the last decision
         self.previous_states = []
         self.previous_actions = []
     
-    def getLegalActions(self):
-        return self.state.getLegalPacmanActions()
-
-    # A* search using priority queue
-    # Finds shortest distance between pacman and an object
-    def shortestDistance(self, pacman, object, walls):
-
-        # priority queue that stores the next positions to be explored in the A* search algorithm
-        frontier = PriorityQueue()
+    def __eq__(self, other):
+        return isinstance(other, GameStateFeatures) and self.key == other.key
 
-        # dict that maps a position to the previous position visited in the search, forming the shortest path
-        came_from = {}
+    def __hash__(self):
+        return self.hash
 
-        # dict that maps a position to the cost (distance) to reach that position from the starting position (pacman)
-        cost_so_far = {}
-
-        # Init pacman as starting position
-        frontier.put((0, pacman))
-        came_from[pacman] = None
-        cost_so_far[pacman] = 0
-
-        # Loops until object coordinates are found
-        while not frontier.empty():
-            _, current = frontier.get()
-
-            if current == object:
-                break
-            
-            # Searches for object by incrementing by one the coordinates in every direction starting from starting position (pacman)
-            for next_pos in [(current[0] + 1, current[1]), (current[0] - 1, current[1]),
-                            (current[0], current[1] + 1), (current[0], current[1] - 1)]:
-                
-                # Check if next postion is a wall
-                if next_pos in walls:
-                    continue
-                
-                new_cost = cost_so_far[current] + 1
-                # Check if next position hasn't been visited or cost to reach said position is inferior
-                if next_pos not in cost_so_far or new_cost < cost_so_far[next_pos]:
-                    # Update cost
-                    cost_so_far[next_pos] = new_cost
-                    priority = new_cost + self.estimateDistance(object, next_pos)
-                    frontier.put((priority, next_pos))
-                    came_from[next_pos] = current
-
-        # Compute the distance between pacman and object
-        distance = 0
-        current = object
-
-        # Increments distance for every step between the object and pacman
-        # Until it reaches pacman
-        while current != pacman:
-    
-            distance += 1
-
-            # Exception catcher to resolve error where scared ghosts have position of (x +/-O.5, y +/-0.5)
-            try:
-                current = came_from[current]
-            except Exception:
-               # If coordinates float turn to int
-               current = (round(current[0]),round(current[1]))
+    # The part of the game state the agent learns from: pacman's position, the ghosts' positions, which ghosts
+    # are scared, the food as a bitmask over the grid (bit x * height + y) and the capsules left
+    # Hashing GameState itself goes through every agent state and every cell of the food Grid on each lookup
+    @staticmethod
+    def stateKey(state: GameState):
+        ghostStates = state.getGhostStates()
+        return (state.getPacmanPosition(),
+                tuple(ghost.getPosition() for ghost in ghostStates),
+                tuple(ghost.scaredTimer > 0 for ghost in ghostStates),
+                foodBitmask(state.getFood()),
+                tuple(state.getCapsules()))
 
-        return distance
+    def getLegalActions(self):
+        return self.state.getLegalPacmanActions()
 
-    # computes the estimated distance between two positions
-    def estimateDistance(self, a, b):
-        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+    # Maze distance between pacman and an object (e.g. a ghost, which may be halfway between two cells)
+    # Looked up in the distances of the layout, which are computed once per layout (see distances.py)
+    def shortestDistance(self, pacman, object):
+        return MazeDistances.forWalls(self.state.getWalls()).distance(pacman, object)
 
 
 class QLearnAgent(Agent):
 
+    # The agent never changes the states it is given, so the training runner does not need to copy them
+    observesWithoutCopy = True
+
     def __init__(self,
                  alpha: float = 0.2,
                  epsilon: float = 0.05,
                  gamma: float = 0.8,
                  maxAttempts: int = 30,
-                 numTraining: int = 300):
+                 numTraining: int = 300,
+                 maxEntries: int = 0,
+                 eviction: str = "lru",
+                 load: str = None,
+                 save: str = None,
+                 checkpointEvery: int = 0,
+                 qTable: str = "sparse",
+                 maxDenseStates: int = 1000000,
+                 replay: int = 0,
+                 replayBatch: int = 32,
+                 replayEvery: str = "step",
+                 replaySeed: int = 0,
+                 traceDecay: float = 0,
+                 traceMode: str = "watkins",
+                 traceThreshold: float = 0.01):
         """
         These values are either passed from the command line (using -a alpha=0.5,...)
         or are set to the default values above.
@@ -149,6 +142,26 @@ class QLearnAgent(Agent):
             gamma: discount factor
             maxAttempts: How many times to try each action in each state
             numTraining: number of training episodes
+            maxEntries: maximum number of (state, action) pairs to remember, 0 for no limit
+            eviction: which pairs to forget first once maxEntries is reached,
+                "lru" (least recently used) or "visits" (least visited)
+            load: checkpoint to start from. The episodes it was trained for count as played,
+                so once they reach numTraining the agent does not learn or explore any more
+            save: checkpoint to write the Q-table to at the end of training
+            checkpointEvery: also write it every this many training episodes, 0 for only at the end
+            qTable: "dense" to keep the Q-values in an array with a row for every state of the layout,
+                "sparse" to only store what was learned, "auto" for dense when the layout has at most
+                maxDenseStates states (and NumPy is installed). A loaded checkpoint is always sparse
+            maxDenseStates: the most states a dense Q-table may have
+            replay: number of past transitions to keep for experience replay, 0 for no replay
+            replayBatch: how many of them to learn from again each time
+            replayEvery: "step" to learn from them after every move, "episode" after every game
+            replaySeed: seed of the generator the replayed transitions are sampled with
+            traceDecay: lambda of Q(lambda), how much of each update is passed back to the state-action
+                pairs that led to it, 0 for one-step Q-learning
+            traceMode: "watkins" for Watkins's Q(lambda), which cuts the traces after an exploratory action,
+                "sarsa" for SARSA(lambda), which learns the value of the actions actually taken
+            traceThreshold: eligibility below which a pair is dropped from the traces
         """
         super().__init__()
         self.alpha = float(alpha)
@@ -162,11 +175,75 @@ class QLearnAgent(Agent):
         # Set epsilon to 0.1 insted of default 0.05
         self.setEpsilon(0.1)
 
-        # Where the Q-value table is
-        self.q_values = util.Counter()
-
-        # Where the visitations are stored --> used for frequencies
-        self.visitations = util.Counter()
+        # Where the Q-value table and the visitations (used for frequencies) are
+        # Missing entries are 0 and zero Q-values are never stored
+        if load is None:
+            self.q_table = QTable(int(maxEntries), eviction)
+        else:
+            self.q_table = QTable.load(load, int(maxEntries), eviction)
+            self.episodesSoFar = self.q_table.base.episodes
+            if self.episodesSoFar >= self.numTraining:
+                self.setAlpha(0)
+                self.setEpsilon(0)
+
+        # Which Q-table to use once the layout is known (see registerInitialState)
+        if qTable not in ("auto", "dense", "sparse"):
+            raise ValueError("Unknown Q-table: " + str(qTable))
+        self.qTableType = qTable
+        self.maxDenseStates = int(maxDenseStates)
+
+        # Where and how often the Q-table is saved (see checkpoint)
+        self.savePath = save
+        self.checkpointEvery = int(checkpointEvery)
+
+        # Experience replay (see replay.py). The buffer is made by the first transition, once the Q-table is known
+        if replayEvery not in ("step", "episode"):
+            raise ValueError("Unknown replayEvery: " + str(replayEvery))
+        self.replaySize = int(replay)
+        self.replayBatch = int(replayBatch)
+        self.replayEvery = replayEvery
+        self.replaySeed = int(replaySeed)
+        self.replay_buffer = None
+
+        # Eligibility traces of the pairs visited this episode, only the ones above traceThreshold are kept
+        if traceMode not in ("watkins", "sarsa"):
+            raise ValueError("Unknown traceMode: " + str(traceMode))
+        self.traceDecay = float(traceDecay)
+        self.traceMode = traceMode
+        self.traceThreshold = float(traceThreshold)
+        self.traces = {}
+        # SARSA(lambda) learns from a move once the next one is chosen: (key, reward) of the move waiting for it
+        self.pendingMove = None
+
+        # The move learned from once the state it leads to is observed (see observationFunction):
+        # (GameStateFeatures, action, whether it was exploratory), None at the start of a game
+        self.lastMove = None
+        # GameStateFeatures of the last observed state, reused by getAction
+        self.observed = None
+        self.lastCheckpoint = self.episodesSoFar
+
+    def registerInitialState(self, state: GameState):
+        """
+        Switches to a dense Q-table at the start of the first game, if one was asked for
+        and the layout is small enough
+        """
+        self.lastMove = None
+        self.observed = None
+        if self.qTableType == "sparse" or isinstance(self.q_table, DenseQTable):
+            return
+        if self.q_table.base is not None or self.q_table.counts:
+            return
+        table = DenseQTable.forState(state, self.maxDenseStates)
+        if table is not None:
+            self.q_table = table
+        elif self.qTableType == "dense":
+            raise Exception("A dense Q-table needs NumPy and a layout with at most %d states" % self.maxDenseStates)
+
+    # Copies of the agent made for parallel training leave saving checkpoints to the original
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['savePath'] = None
+        return state
     
     # =============================================================================================================================
     # ===========================================================[ Helpers ]=======================================================
@@ -224,7 +301,7 @@ class QLearnAgent(Agent):
             empty = -0.5
             capsuleReward = 5
 
-            walls = startState.getWalls().asList()
+            distances = MazeDistances.forWalls(startState.getWalls())
             pacmanNextPosition = endState.getPacmanPosition()
             
             reward = 0
@@ -232,7 +309,7 @@ class QLearnAgent(Agent):
             # Assigne respective rewards based on pacman's trajectory
             if pacmanNextPosition in startState.getGhostPositions():
                 reward = enemyReward
-            elif pacmanNextPosition in startState.getFood().asList():
+            elif startState.hasFood(*pacmanNextPosition):
                 reward =  foodReward
             elif pacmanNextPosition in startState.getCapsules():
                 reward = capsuleReward
@@ -244,7 +321,7 @@ class QLearnAgent(Agent):
             # Checks if a ghost is close to pacman 
             # The closer a ghost is the more negative a reward is
             for ghost in ghosts:
-                distanceFromGhost = GameStateFeatures(endState).shortestDistance(pacmanNextPosition, ghost, walls)
+                distanceFromGhost = distances.distance(pacmanNextPosition, ghost)
                 if distanceFromGhost <= 4:
                     reward = reward - 1
                 else:
@@ -254,7 +331,7 @@ class QLearnAgent(Agent):
             # Checks if a food is close to pacman 
             # The closer a food is the more positive a reward is
             for food in foods:
-                distanceFromFood = GameStateFeatures(startState).shortestDistance(pacmanNextPosition, food, walls)
+                distanceFromFood = distances.cellDistance(pacmanNextPosition, food)
                 if distanceFromFood <= 1:
                     reward = reward + 1
             
@@ -277,7 +354,7 @@ class QLearnAgent(Agent):
         Returns:
             Q(state, action)
         """
-        return self.q_values[(state, action)]
+        return self.q_table.getValue((state.key, action))
 
 
     # WARNING: You will be tested on the functionality of this method
@@ -289,20 +366,8 @@ class QLearnAgent(Agent):
         Returns:
             q_value: the maximum estimated Q-value attainable from the state
         """
-        # Initialise an empty list
-        q_values = []
-
-        # Look through all legal actions and return the one with highest known utility given the state
-        legal_actions = state.getLegalActions()
-        for action in legal_actions:
-            if self.visitations[(state,action)] != 0:
-                q = self.getQValue(state, action)
-                q_values.append(q)
-        # If utilities aren't found initialize to 0
-        if len(q_values) == 0:
-            return 0 
-        else:
-            return max(q_values)
+        # The highest known utility of the actions taken in the state (all of them legal), 0 if none was taken yet
+        return self.q_table.maxValue(state.key)
 
     # WARNING: You will be tested on the functionality of this method
     # DO NOT change the function signature
@@ -321,7 +386,8 @@ class QLearnAgent(Agent):
         """
 
         # Ref: https://keats.kcl.ac.uk/pluginfile.php/8500678/mod_resource/content/15/rl2.pdf (slide 42)
-        self.q_values[(state, action)] = self.getQValue(state, action) + self.alpha * (reward + self.gamma * self.maxQValue(nextState) - self.getQValue(state,action))
+        q = self.getQValue(state, action)
+        self.q_table.setValue((state.key, action), q + self.alpha * (reward + self.gamma * self.maxQValue(nextState) - q))
 
 
     # WARNING: You will be tested on the functionality of this method
@@ -336,7 +402,7 @@ class QLearnAgent(Agent):
             action: Action taken
         """
         # Increment by one if an action in that state is made
-        self.visitations[(state, action)] += 1
+        self.q_table.incrementCount((state.key, action))
 
     # WARNING: You will be tested on the functionality of this method
     # DO NOT change the function signature
@@ -351,7 +417,7 @@ class QLearnAgent(Agent):
             Number of times that the action has been taken in a given state
         """
 
-        return self.visitations[(state, action)]
+        return self.q_table.getCount((state.key, action))
 
     # WARNING: You will be tested on the functionality of this method
     # DO NOT change the function signature
@@ -387,10 +453,21 @@ class QLearnAgent(Agent):
         if Directions.STOP in legal:
             legal.remove(Directions.STOP)
     
+        # Learn from the last move, if the game did not show this state to observationFunction first
+        if self.lastMove is not None:
+            self.observationFunction(state)
+
+        # The Q-table is keyed on the compact GameStateFeatures key rather than on the GameState
+        if self.observed is not None and self.observed.state is state:
+            stateFeatures = self.observed
+        else:
+            stateFeatures = GameStateFeatures(state)
+        self.observed = None
+
         # Dictionary containing all utlities of states that can be visited
         actionUtility = {}
         for possibleAction in legal:
-            actionUtility[possibleAction] = self.getQValue(state, possibleAction)
+            actionUtility[possibleAction] = self.getQValue(stateFeatures, possibleAction)
         # returns state with max utility out of all legal states
         bestAction = max(actionUtility, key=actionUtility.get)
 
@@ -400,19 +477,10 @@ class QLearnAgent(Agent):
         else:
             chosenAction = bestAction
 
-        # Removes entries where utilities are 0 (created by the Counter class)
-        for k,v in list(self.q_values.items()):
-            if v == 0:
-                del self.q_values[k]
-
-        # Update Q-values
+        # It is learned from once the state it leads to is observed
+        self.lastMove = (stateFeatures, chosenAction, actionUtility[chosenAction] < actionUtility[bestAction])
+        self.updateCount(stateFeatures, chosenAction)
 
-        nextState = state.generatePacmanSuccessor(chosenAction)
-        reward = self.computeReward(state, nextState)
-        self.learn(state, chosenAction, reward, nextState)
-
-        self.updateCount(state, chosenAction)
-       
         # Returns best action or possibly random chosen action when being trained
         return chosenAction
 
@@ -426,9 +494,288 @@ class QLearnAgent(Agent):
             state: the final game state
         """
         print(f"Game {self.getEpisodesSoFar()} just ended!")
+        self.observationFunction(state)
+        self.observed = None
+        if self.pendingMove is not None:
+            key, reward = self.pendingMove
+            self.updateTraces(key, reward - self.q_table.getValue(key))
+        self.traces = {}
+        self.pendingMove = None
+        if self.replayEvery == "episode" and self.replay_buffer is not None and self.getAlpha() > 0:
+            self.replayExperience()
         self.incrementEpisodesSoFar()
         if self.getEpisodesSoFar() == self.getNumTraining():
-            msg = 'Training Done (turning off epsilon and alpha)'
-            print('%s\n%s' % (msg, '-' * len(msg)))
-            self.setAlpha(0)
-            self.setEpsilon(0)
\ No newline at end of file
+            self.finishTraining()
+        elif self.getEpisodesSoFar() < self.getNumTraining():
+            self.checkpointIfDue()
+
+    def observationFunction(self, state: GameState) -> GameState:
+        """
+        Called by the game with the state before every move of the agent (and by final with the
+        last state of the game): learns from the agent's last move, now that the state it led to,
+        after the ghosts moved, is known. The game already generated that state, so the agent
+        does not generate successors of its own
+        Args:
+            state: the current state
+        Returns:
+            the state, as the observation passed to getAction
+        """
+        self.observed = GameStateFeatures(state)
+        if self.lastMove is None:
+            return state
+        lastFeatures, lastAction, exploratory = self.lastMove
+        self.lastMove = None
+        if self.getAlpha() <= 0:
+            return state
+
+        reward = self.computeReward(lastFeatures.state, state)
+        if self.traceDecay > 0:
+            self.learnWithTraces(lastFeatures, lastAction, reward, self.observed, exploratory)
+        else:
+            self.learn(lastFeatures, lastAction, reward, self.observed)
+
+        # Keep the transition to learn from it again
+        if self.replaySize > 0:
+            self.remember(lastFeatures, lastAction, reward, self.observed, state.isWin() or state.isLose())
+            if self.replayEvery == "step":
+                self.replayExperience()
+        return state
+
+    def learnWithTraces(self,
+                        state: GameStateFeatures,
+                        action: Directions,
+                        reward: float,
+                        nextState: GameStateFeatures,
+                        exploratory: bool):
+        """
+        Q(lambda) update: the TD error of the move is applied to every pair in the eligibility traces
+        Args:
+            exploratory: whether the action was not the greedy one
+        """
+        key = (state.key, action)
+        if self.traceMode == "sarsa":
+            # The move that led to this state can be learned from now that this action is chosen
+            if self.pendingMove is not None:
+                pendingKey, pendingReward = self.pendingMove
+                self.updateTraces(pendingKey, pendingReward + self.gamma * self.q_table.getValue(key)
+                                  - self.q_table.getValue(pendingKey))
+            self.pendingMove = (key, reward)
+            return
+        # The pairs before an exploratory action did not lead to it following the greedy policy
+        if exploratory:
+            self.traces = {}
+        self.updateTraces(key, reward + self.gamma * self.maxQValue(nextState) - self.q_table.getValue(key))
+
+    def updateTraces(self, key, error: float):
+        """
+        Sets the trace of key to 1 (replacing traces), moves the Q-value of every traced pair by
+        alpha * error * trace, then decays the traces by gamma * lambda and drops the ones below
+        traceThreshold. The cost is the number of traced pairs, not the size of the Q-table
+        """
+        traces = self.traces
+        traces[key] = 1.0
+        step = self.alpha * error
+        decay = self.gamma * self.traceDecay
+        for tracedKey, trace in list(traces.items()):
+            self.q_table.setValue(tracedKey, self.q_table.getValue(tracedKey) + step * trace)
+            trace *= decay
+            if trace < self.traceThreshold:
+                del traces[tracedKey]
+            else:
+                traces[tracedKey] = trace
+
+    def remember(self,
+                 state: GameStateFeatures,
+                 action: Directions,
+                 reward: float,
+                 nextState: GameStateFeatures,
+                 terminal: bool):
+        """
+        Adds a transition to the experience replay buffer. With a dense Q-table the buffer
+        holds the table's rows and columns, so that it can be learned from in batches
+        """
+        dense = isinstance(self.q_table, DenseQTable)
+        if self.replay_buffer is None:
+            self.replay_buffer = ReplayBuffer(self.replaySize, rows=dense, seed=self.replaySeed)
+        if dense:
+            self.replay_buffer.add(self.q_table.stateIndex(state.key), DenseQTable.MOVE_COLUMN[action], reward,
+                                   self.q_table.stateIndex(nextState.key), terminal)
+        else:
+            self.replay_buffer.add(state.key, action, reward, nextState.key, terminal)
+
+    def replayExperience(self):
+        """
+        Learns again from replayBatch transitions sampled from the experience replay buffer, in one
+        batch so that both kinds of Q-table learn the same from it. Replayed transitions do not count as visits
+        """
+        buffer = self.replay_buffer
+        self.q_table.learnBatch(*buffer.transitions(buffer.sample(self.replayBatch)), self.alpha, self.gamma)
+
+    def finishTraining(self):
+        msg = 'Training Done (turning off epsilon and alpha)'
+        print('%s\n%s' % (msg, '-' * len(msg)))
+        print(self.q_table.describe())
+        self.setAlpha(0)
+        self.setEpsilon(0)
+        if self.savePath is not None:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Saves the Q-table and visitation counts, with the number of episodes played, to the save path
+        """
+        self.q_table.save(self.savePath, self.getEpisodesSoFar())
+        self.lastCheckpoint = self.getEpisodesSoFar()
+
+    def checkpointIfDue(self):
+        if self.savePath is not None and self.checkpointEvery > 0 and \
+                self.getEpisodesSoFar() // self.checkpointEvery > self.lastCheckpoint // self.checkpointEvery:
+            self.checkpoint()
+
+    def mergeParallelAgents(self, agents: list):
+        """
+        Used by parallel training (pacman.py --workers): merges copies of this agent that each
+        played some training episodes into this one. Their Q-values are averaged, weighted by
+        visits, and the episodes they played count as played by this agent
+        Args:
+            agents: the copies of this agent, which started from its current Q-table
+        """
+        played = sum(agent.getEpisodesSoFar() - self.getEpisodesSoFar() for agent in agents)
+        # The copies chose their Q-table in their first game, which this agent has not played
+        if isinstance(agents[0].q_table, DenseQTable) and not isinstance(self.q_table, DenseQTable):
+            self.q_table = agents[0].q_table.emptyCopy()
+        self.q_table = type(self.q_table).merge(self.q_table, [agent.q_table for agent in agents])
+        wasTraining = self.getEpisodesSoFar() < self.getNumTraining()
+        self.episodesSoFar += played
+        if wasTraining and self.getEpisodesSoFar() >= self.getNumTraining():
+            self.finishTraining()
+        elif wasTraining:
+            self.checkpointIfDue()
+
+
+class ApproximateQAgent(Agent):
+    """
+    Q-learning with a linear function approximation: Q(state, action) is the dot product of a
+    weight vector with the features of the action (see features.py). The agent only learns
+    FeatureExtractor.NUM_FEATURES weights, so its memory does not grow with the states it sees
+    and what it learns carries over to states and layouts it has not seen, e.g.
+
+        python3 pacman.py -p ApproximateQAgent -x 50 -n 60 -l mediumClassic
+    """
+
+    observesWithoutCopy = True
+
+    def __init__(self,
+                 alpha: float = 0.2,
+                 epsilon: float = 0.05,
+                 gamma: float = 0.8,
+                 numTraining: int = 300):
+        """
+        Args:
+            alpha: learning rate
+            epsilon: exploration rate
+            gamma: discount factor
+            numTraining: number of training episodes
+        """
+        super().__init__()
+        if not _NUMPY_ENABLED:
+            raise Exception("ApproximateQAgent needs NumPy")
+        self.alpha = float(alpha)
+        self.epsilon = float(epsilon)
+        self.gamma = float(gamma)
+        self.numTraining = int(numTraining)
+        self.episodesSoFar = 0
+
+        self.extractor = FeatureExtractor()
+        self.weights = numpy.zeros(FeatureExtractor.NUM_FEATURES)
+
+        # The last state, the features of the action taken in it and its Q-value, learned from
+        # once the next state (or the end of the game) is known
+        self.lastState = None
+        self.lastFeatures = None
+        self.lastValue = 0.0
+
+    # Accessor functions for the variable episodesSoFar controlling learning
+    def incrementEpisodesSoFar(self):
+        self.episodesSoFar += 1
+
+    def getEpisodesSoFar(self):
+        return self.episodesSoFar
+
+    def getNumTraining(self):
+        return self.numTraining
+
+    def getAlpha(self) -> float:
+        return self.alpha
+
+    def getWeights(self) -> dict:
+        return dict(zip(FeatureExtractor.NAMES, self.weights))
+
+    def learn(self, reward: float, target: float):
+        """
+        Moves the weights of the features of the last action towards the target
+        Args:
+            reward: the reward received since the last action
+            target: the discounted value of the state the action led to, 0 at the end of the game
+        """
+        difference = reward + self.gamma * target - self.lastValue
+        self.weights += self.alpha * difference * self.lastFeatures
+
+    def getAction(self, state: GameState) -> Directions:
+        """
+        Learns from the last action, now that the state it led to is known, then picks
+        the action with the highest Q-value, or a random one with probability epsilon
+        """
+        legal = state.getLegalPacmanActions()
+        if Directions.STOP in legal:
+            legal.remove(Directions.STOP)
+
+        features = self.extractor.actionFeatures(GameStateFeatures(state), legal)
+        values = features.dot(self.weights)
+
+        if self.lastState is not None and self.alpha > 0:
+            self.learn(state.getScore() - self.lastState.getScore(), values.max())
+            values = features.dot(self.weights)
+
+        if util.flipCoin(self.epsilon):
+            choice = random.randrange(len(legal))
+        else:
+            best = numpy.flatnonzero(values == values.max())
+            choice = best[0] if len(best) == 1 else random.choice(best)
+
+        self.lastState = state
+        self.lastFeatures = features[choice]
+        self.lastValue = values[choice]
+        return legal[choice]
+
+    def final(self, state: GameState):
+        """
+        Learns from the last action of the game, which has no next state to value
+        """
+        print(f"Game {self.getEpisodesSoFar()} just ended!")
+        if self.lastState is not None and self.alpha > 0:
+            self.learn(state.getScore() - self.lastState.getScore(), 0.0)
+        self.lastState = None
+        self.lastFeatures = None
+        self.incrementEpisodesSoFar()
+        if self.getEpisodesSoFar() == self.getNumTraining():
+            self.finishTraining()
+
+    def finishTraining(self):
+        msg = 'Training Done (turning off epsilon and alpha)'
+        print('%s\n%s' % (msg, '-' * len(msg)))
+        print("Weights: " + ", ".join("%s %.3f" % item for item in self.getWeights().items()))
+        self.alpha = 0
+        self.epsilon = 0
+
+    def mergeParallelAgents(self, agents: list):
+        """
+        Used by parallel training (pacman.py --workers): averages the weights learned by copies of
+        this agent, and counts the episodes they played as played by this agent
+        """
+        played = sum(agent.getEpisodesSoFar() - self.getEpisodesSoFar() for agent in agents)
+        self.weights = numpy.mean([agent.weights for agent in agents], axis=0)
+        wasTraining = self.getEpisodesSoFar() < self.getNumTraining()
+        self.episodesSoFar += played
+        if wasTraining and self.getEpisodesSoFar() >= self.getNumTraining():
+            self.finishTraining()
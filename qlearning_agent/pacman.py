@@ -51,6 +51,7 @@ from six.moves import range
 
 import pacman_utils.layout as layout
 from pacman_utils.game import Actions
+from pacman_utils.game import Configuration
 from pacman_utils.game import Directions
 from pacman_utils.game import Game
 from pacman_utils.game import GameStateData
@@ -81,16 +82,29 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
+    # Instrumentation of the states generated during a game, off by default (see trackExplored):
+    # None, "count" to only count the successors generated, or "states" to also keep every state
+    # in explored. Both are reset at the start of every game
+    exploredTracking = None
     explored = set()
+    exploredCount = 0
 
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
+        tmp = GameState.explored
         GameState.explored = set()
+        GameState.exploredCount = 0
         return tmp
 
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def trackExplored(mode):
+        if mode not in (None, 'count', 'states'):
+            raise Exception('Unknown explored tracking: ' + str(mode))
+        GameState.exploredTracking = mode
+        GameState.getAndResetExplored()
+
+    trackExplored = staticmethod(trackExplored)
+
     def getLegalActions(self, agentIndex=0):
         """
         Returns the legal actions for the agent specified.
@@ -125,7 +139,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
         else:
-            GhostRules.decrementTimer(state.data.agentStates[agentIndex])
+            GhostRules.decrementTimer(state.data.ownAgentState(agentIndex))
 
         # Resolve multi-agent effects
         GhostRules.checkDeath(state, agentIndex)
@@ -133,8 +147,11 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.exploredTracking is not None:
+            GameState.exploredCount += 1
+            if GameState.exploredTracking == 'states':
+                GameState.explored.add(self)
+                GameState.explored.add(state)
         return state
 
     def getLegalPacmanActions(self):
@@ -182,7 +199,7 @@ class GameState:
 
     def getCapsules(self):
         """
-        Returns a list of positions (x,y) of the remaining capsules.
+        Returns a tuple of positions (x,y) of the remaining capsules.
         """
         return self.data.capsules
 
@@ -294,6 +311,7 @@ class ClassicGameRules:
         game = Game(agents, display, self, catchExceptions=catchExceptions)
         game.state = initState
         self.initialState = initState.deepCopy()
+        GameState.getAndResetExplored()
         self.quiet = quiet
         return game
 
@@ -360,7 +378,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.ownAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector(action, PacmanRules.PACMAN_SPEED)
@@ -381,20 +399,19 @@ class PacmanRules:
         if state.data.food[x][y]:
             state.data.scoreChange += 10
             state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.food.set(x, y, False)
             state.data._foodEaten = position
-            # TODO: cache numFood?
             numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if (position in state.getCapsules()):
-            state.data.capsules.remove(position)
+            state.data.capsules = tuple(capsule for capsule in state.data.capsules if capsule != position)
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range(1, len(state.data.agentStates)):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.ownAgentState(index).scaredTimer = SCARED_TIME
 
     consume = staticmethod(consume)
 
@@ -427,7 +444,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.ownAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector(action, speed)
@@ -438,7 +455,9 @@ class GhostRules:
     def decrementTimer(ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint(ghostState.configuration.pos)
+            # Configurations are shared between states, so the ghost gets a new one
+            configuration = ghostState.configuration
+            ghostState.configuration = Configuration(nearestPoint(configuration.pos), configuration.direction)
         ghostState.scaredTimer = max(0, timer - 1)
 
     decrementTimer = staticmethod(decrementTimer)
@@ -462,9 +481,11 @@ class GhostRules:
     def collide(state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            ghostState = state.data.ownAgentState(agentIndex)
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
-            # Added for first-person
+            # Added for first-person. The list may be shared with the predecessor
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -555,6 +576,14 @@ def readCommand(argv):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes to play the training episodes in'), default=1)
+    parser.add_option('--mergeEvery', dest='mergeEvery', type='int',
+                      help=default('Training episodes each worker plays between merges of what the workers learned'),
+                      default=50)
+    parser.add_option('--explored', dest='explored', type='choice', choices=['count', 'states'],
+                      help='Report the successors generated in every game ("count"), or also the distinct states '
+                           '("states", which keeps every state of the game in memory)', default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -564,6 +593,9 @@ def readCommand(argv):
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
 
+    # Instrument the states generated in every game
+    GameState.trackExplored(options.explored)
+
     # Choose a layout
     args['layout'] = layout.getLayout(options.layout)
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
@@ -602,6 +634,8 @@ def readCommand(argv):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['workers'] = options.workers
+    args['mergeEvery'] = options.mergeEvery
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
@@ -701,7 +735,84 @@ def replayGame(layout, actions, display):
     display.finish()
 
 
-def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30):
+def runTrainingEpisode(rules, layout, pacman, ghosts):
+    """
+    Plays a training episode headless: the agents are called in the same order and the
+    same rules apply as in Game.run, but there is no display, no timeouts, no stdout
+    muting and no move history. Agents with observesWithoutCopy get the game state itself
+    instead of a deep copy, which is safe as generating a successor never changes the
+    state it is generated from
+    """
+    import pacman_utils.textDisplay as textDisplay
+    game = rules.newGame(layout, pacman, ghosts, textDisplay.NullGraphics(), True, False)
+    agents = game.agents
+    copies = [not getattr(agent, 'observesWithoutCopy', False) for agent in agents]
+    for agent, copy in zip(agents, copies):
+        if hasattr(agent, 'registerInitialState'):
+            agent.registerInitialState(game.state.deepCopy() if copy else game.state)
+    observers = [getattr(agent, 'observationFunction', None) for agent in agents]
+    actions = [agent.getAction for agent in agents]
+
+    state = game.state
+    numAgents = len(agents)
+    agentIndex = game.startingIndex
+    while not game.gameOver:
+        observation = state.deepCopy() if copies[agentIndex] else state
+        if observers[agentIndex] is not None:
+            observation = observers[agentIndex](observation)
+        state = state.generateSuccessor(agentIndex, actions[agentIndex](observation))
+        game.state = state
+        rules.process(state, game)
+        agentIndex = (agentIndex + 1) % numAgents
+
+    for agent in agents:
+        if hasattr(agent, 'final'):
+            agent.final(state)
+    return game
+
+
+def runTrainingEpisodes(layout, pacman, ghosts, numEpisodes, seed, catchExceptions, timeout):
+    """
+    Plays training episodes quietly in a worker process of runParallelTraining
+    and returns the agent, with what it learned
+    """
+    import pacman_utils.textDisplay as textDisplay
+    random.seed(seed)
+    rules = ClassicGameRules(timeout)
+    rules.quiet = True
+    for i in range(numEpisodes):
+        if catchExceptions:
+            game = rules.newGame(layout, pacman, ghosts, textDisplay.NullGraphics(), True, catchExceptions)
+            game.run()
+        else:
+            runTrainingEpisode(rules, layout, pacman, ghosts)
+    return pacman
+
+
+def runParallelTraining(layout, pacman, ghosts, numTraining, workers, mergeEvery, catchExceptions=False, timeout=30):
+    """
+    Plays the training episodes in a pool of worker processes. In every round each worker
+    gets a copy of the agent and its own seed and plays up to mergeEvery episodes, then
+    the copies are merged back into the agent (see mergeParallelAgents) for the next round
+    """
+    import multiprocessing
+    pool = multiprocessing.Pool(workers)
+    try:
+        remaining = numTraining
+        while remaining > 0:
+            episodes = min(remaining, workers * mergeEvery)
+            shares = [episodes // workers + (1 if w < episodes % workers else 0) for w in range(workers)]
+            tasks = [(layout, pacman, ghosts, share, random.randrange(2 ** 31), catchExceptions, timeout)
+                     for share in shares if share > 0]
+            pacman.mergeParallelAgents(pool.starmap(runTrainingEpisodes, tasks))
+            remaining -= episodes
+    finally:
+        pool.close()
+        pool.join()
+
+
+def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, catchExceptions=False, timeout=30,
+             workers=1, mergeEvery=50):
     # noinspection PyUnresolvedReferences
     import __main__
     __main__.__dict__['_display'] = display
@@ -709,7 +820,19 @@ def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, c
     rules = ClassicGameRules(timeout)
     games = []
 
-    for i in range(numGames):
+    # Training episodes an agent has already played (e.g. in a checkpoint it loaded) are not played again
+    firstGame = 0
+    if hasattr(pacman, 'getEpisodesSoFar'):
+        firstGame = min(pacman.getEpisodesSoFar(), numTraining, numGames)
+
+    # Agents that can merge copies of themselves train in parallel, the evaluation games are then
+    # played by the merged agent
+    if workers > 1 and numTraining > firstGame and hasattr(pacman, 'mergeParallelAgents'):
+        runParallelTraining(layout, pacman, ghosts, min(numTraining, numGames) - firstGame, workers, mergeEvery,
+                            catchExceptions, timeout)
+        firstGame = min(numTraining, numGames)
+
+    for i in range(firstGame, numGames):
         beQuiet = i < numTraining
         if beQuiet:
             # Suppress output and graphics
@@ -719,9 +842,17 @@ def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, c
         else:
             gameDisplay = display
             rules.quiet = False
-        game = rules.newGame(layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-        game.run()
+        if beQuiet and not record and not catchExceptions:
+            # Training episodes that are not recorded do not need what Game.run does for the display,
+            # timeouts and the move history
+            game = runTrainingEpisode(rules, layout, pacman, ghosts)
+        else:
+            game = rules.newGame(layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
+            game.run()
         if not beQuiet: games.append(game)
+        if GameState.exploredTracking is not None:
+            game.exploredCount = GameState.exploredCount
+            game.exploredStates = len(GameState.getAndResetExplored())
 
         if record:
             import time, six.moves.cPickle
@@ -739,6 +870,10 @@ def runGames(layout, pacman, ghosts, display, numGames, record, numTraining=0, c
         print('Scores:       ', ', '.join([str(score) for score in scores]))
         print('Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate))
         print('Record:       ', ', '.join([['Loss', 'Win'][int(w)] for w in wins]))
+        if GameState.exploredTracking is not None:
+            print('Successors:   ', ', '.join([str(game.exploredCount) for game in games]))
+        if GameState.exploredTracking == 'states':
+            print('Explored:     ', ', '.join([str(game.exploredStates) for game in games]))
 
     return games
 
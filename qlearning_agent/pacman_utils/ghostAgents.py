@@ -24,6 +24,8 @@ from six.moves import zip
 
 
 class GhostAgent(Agent):
+    observesWithoutCopy = True
+
     def __init__(self, index):
         super().__init__(index)
         self.index = index
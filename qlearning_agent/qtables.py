@@ -0,0 +1,675 @@
+# qtables.py
+#
+# Storage for the Q-values and visit counts of QLearnAgent.
+#
+# Keys are (GameStateFeatures.key, action) pairs. A key that is not stored has
+# Q-value 0 and count 0, and a Q-value of exactly 0 is never written, so the
+# table only ever holds what the agent has learned.
+#
+# A table can be saved to a binary checkpoint (see QTable.save) and loaded back
+# by memory-mapping the file, so loading takes the same time however large the
+# table is. The loaded rows stay in the file and are only read when looked up;
+# what the agent learns after loading is kept in memory on top of them.
+#
+# Checkpoint format (little endian):
+#   header: magic b"QTBL", version (uint16), key width (uint16), rows (uint32), episodes trained (uint32)
+#   rows sorted by key: packed state key (see packStateKey) padded with zero bytes to the key width,
+#   Q-values (float32) and visit counts (uint32) of the actions in ACTIONS order
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import heapq
+import mmap
+import os
+import struct
+from collections import OrderedDict
+
+from pacman_utils.game import Directions
+
+try:
+    import numpy
+    _NUMPY_ENABLED = True
+except ImportError:
+    _NUMPY_ENABLED = False
+
+# Eviction policies for a bounded QTable
+EVICT_LRU = "lru"
+EVICT_VISITS = "visits"
+
+# Order of the actions in the rows of a checkpoint
+ACTIONS = (Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP)
+ACTION_COLUMN = dict((action, column) for column, action in enumerate(ACTIONS))
+
+CHECKPOINT_MAGIC = b"QTBL"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER = struct.Struct("<4sHHII")
+CHECKPOINT_ROW = struct.Struct("<%df%dI" % (len(ACTIONS), len(ACTIONS)))
+
+
+# Packs a GameStateFeatures key into bytes. Coordinates are stored in half cells,
+# as scared ghosts can be halfway between two cells
+def packStateKey(stateKey: tuple) -> bytes:
+    pacman, ghosts, scared, food, capsules = stateKey
+    parts = [struct.pack("<BHH", len(ghosts), int(pacman[0] * 2), int(pacman[1] * 2))]
+    for ghost, isScared in zip(ghosts, scared):
+        parts.append(struct.pack("<HHB", int(ghost[0] * 2), int(ghost[1] * 2), isScared))
+    parts.append(struct.pack("<B", len(capsules)))
+    for capsule in capsules:
+        parts.append(struct.pack("<HH", int(capsule[0] * 2), int(capsule[1] * 2)))
+    foodBytes = food.to_bytes((food.bit_length() + 7) // 8, "little")
+    parts.append(struct.pack("<H", len(foodBytes)))
+    parts.append(foodBytes)
+    return b"".join(parts)
+
+
+def unpackCoordinate(halves: int):
+    return halves // 2 if halves % 2 == 0 else halves / 2
+
+
+# Inverse of packStateKey, ignores any padding after the key
+def unpackStateKey(packed: bytes) -> tuple:
+    ghostCount, pacmanX, pacmanY = struct.unpack_from("<BHH", packed, 0)
+    offset = 5
+    ghosts = []
+    scared = []
+    for _ in range(ghostCount):
+        x, y, isScared = struct.unpack_from("<HHB", packed, offset)
+        ghosts.append((unpackCoordinate(x), unpackCoordinate(y)))
+        scared.append(bool(isScared))
+        offset += 5
+    capsuleCount, = struct.unpack_from("<B", packed, offset)
+    offset += 1
+    capsules = []
+    for _ in range(capsuleCount):
+        x, y = struct.unpack_from("<HH", packed, offset)
+        capsules.append((unpackCoordinate(x), unpackCoordinate(y)))
+        offset += 4
+    foodLength, = struct.unpack_from("<H", packed, offset)
+    offset += 2
+    food = int.from_bytes(packed[offset:offset + foodLength], "little")
+    return ((unpackCoordinate(pacmanX), unpackCoordinate(pacmanY)), tuple(ghosts), tuple(scared), food,
+            tuple(capsules))
+
+
+class MappedQTable:
+    """
+    Read-only view of a checkpoint file, memory-mapped so that loading it does not read the rows.
+    A state is found by binary search over the sorted keys
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.keyWidth, self.rows, self.episodes = CHECKPOINT_HEADER.unpack_from(self.map, 0)
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+            raise ValueError(path + " is not a Q-table checkpoint")
+        self.rowSize = self.keyWidth + CHECKPOINT_ROW.size
+        # The state key and row of the last lookup, as the agent looks up all the actions of a state in a row
+        self.lastStateKey = None
+        self.lastRow = -1
+
+    # Memory maps cannot be pickled, so copies of the table (e.g. for parallel training) map the file again
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def findRow(self, stateKey: tuple) -> int:
+        if stateKey == self.lastStateKey:
+            return self.lastRow
+        packed = packStateKey(stateKey)
+        row = -1
+        if len(packed) <= self.keyWidth:
+            packed = packed.ljust(self.keyWidth, b"\0")
+            low, high = 0, self.rows
+            while low < high:
+                middle = (low + high) // 2
+                offset = CHECKPOINT_HEADER.size + middle * self.rowSize
+                key = self.map[offset:offset + self.keyWidth]
+                if key < packed:
+                    low = middle + 1
+                elif key > packed:
+                    high = middle
+                else:
+                    row = middle
+                    break
+        self.lastStateKey = stateKey
+        self.lastRow = row
+        return row
+
+    def readRow(self, row: int) -> tuple:
+        return CHECKPOINT_ROW.unpack_from(self.map, CHECKPOINT_HEADER.size + row * self.rowSize + self.keyWidth)
+
+    # Q-value stored for the (state key, action) pair, None if the file has no row for the state
+    def getValue(self, key) -> float:
+        row = self.findRow(key[0])
+        if row < 0:
+            return None
+        return self.readRow(row)[ACTION_COLUMN[key[1]]]
+
+    def getCount(self, key) -> int:
+        row = self.findRow(key[0])
+        if row < 0:
+            return None
+        return self.readRow(row)[len(ACTIONS) + ACTION_COLUMN[key[1]]]
+
+    # Every (state key, Q-values, counts) in the file
+    def rowsItems(self):
+        for row in range(self.rows):
+            offset = CHECKPOINT_HEADER.size + row * self.rowSize
+            values = CHECKPOINT_ROW.unpack_from(self.map, offset + self.keyWidth)
+            yield (unpackStateKey(self.map[offset:offset + self.keyWidth]), list(values[:len(ACTIONS)]),
+                   list(values[len(ACTIONS):]))
+
+
+class QTable:
+    """
+    Sparse Q-table with the visit counts of the same keys.
+    With maxEntries > 0 the number of counted keys is bounded: once it is
+    exceeded, keys are evicted either least recently used first ("lru") or
+    least visited first ("visits"), together with their Q-values.
+    A table loaded from a checkpoint reads through to the file for the keys
+    it has not changed since; the bound only applies to those changed keys
+    """
+
+    def __init__(self, maxEntries: int = 0, eviction: str = EVICT_LRU):
+        """
+        Args:
+            maxEntries: maximum number of keys to keep, 0 for no limit
+            eviction: "lru" or "visits"
+        """
+        if eviction not in (EVICT_LRU, EVICT_VISITS):
+            raise ValueError("Unknown eviction policy: " + str(eviction))
+        self.maxEntries = int(maxEntries)
+        self.eviction = eviction
+        self.values = {}
+        # Checkpoint the table was loaded from (a MappedQTable), None if it was not
+        self.base = None
+        # Ordered from least to most recently used when evicting by recency
+        self.counts = OrderedDict() if self.maxEntries and eviction == EVICT_LRU else {}
+        self.trackRecency = self.maxEntries > 0 and eviction == EVICT_LRU
+        # Statistics
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def getValue(self, key) -> float:
+        self.lookups += 1
+        value = self.values.get(key)
+        if value is None:
+            if self.base is not None:
+                value = self.base.getValue(key)
+                if value is not None:
+                    self.hits += 1
+                    return value
+            return 0.0
+        self.hits += 1
+        if self.trackRecency:
+            self.counts.move_to_end(key)
+        return value
+
+    def setValue(self, key, value: float):
+        if value == 0 and (self.base is None or not self.base.getValue(key)):
+            self.values.pop(key, None)
+        else:
+            # A zero is only stored to hide a value in the checkpoint
+            self.values[key] = value
+            if key not in self.counts:
+                self.counts[key] = self.baseCount(key)
+                self.evictIfFull(key)
+            elif self.trackRecency:
+                self.counts.move_to_end(key)
+
+    def getCount(self, key) -> int:
+        count = self.counts.get(key)
+        return self.baseCount(key) if count is None else count
+
+    def maxValue(self, stateKey) -> float:
+        """
+        The highest Q-value of the actions that have been taken in the state, 0 if none has
+        """
+        best = None
+        for action in ACTIONS:
+            key = (stateKey, action)
+            if self.getCount(key):
+                value = self.getValue(key)
+                if best is None or value > best:
+                    best = value
+        return 0.0 if best is None else best
+
+    def learnBatch(self, states, actions, rewards, nextStates, terminal, alpha: float, gamma: float):
+        """
+        Q-learning updates of a batch of transitions at once (see replay.py), all computed from the
+        values before the batch. A state and action that is in the batch more than once is moved by
+        the mean of its updates, so it moves by alpha however often it was sampled
+        Args:
+            states, actions: states and actions of the transitions
+            rewards: their rewards
+            nextStates: the states they lead to
+            terminal: whether those states end the game
+        """
+        errors = {}
+        for state, action, reward, nextState, isTerminal in zip(states, actions, rewards, nextStates, terminal):
+            key = (state, action)
+            nextValue = 0.0 if isTerminal else self.maxValue(nextState)
+            if key in errors:
+                current, total, repeats = errors[key]
+            else:
+                current, total, repeats = self.getValue(key), 0.0, 0
+            errors[key] = (current, total + reward + gamma * nextValue - current, repeats + 1)
+        for key, (current, total, repeats) in errors.items():
+            self.setValue(key, current + alpha * total / repeats)
+
+    # Count of the key in the checkpoint the table was loaded from, 0 if there is none
+    def baseCount(self, key) -> int:
+        if self.base is None:
+            return 0
+        return self.base.getCount(key) or 0
+
+    # Q-value of the key without counting it as a lookup
+    def peekValue(self, key) -> float:
+        value = self.values.get(key)
+        if value is None and self.base is not None:
+            value = self.base.getValue(key)
+        return 0.0 if value is None else value
+
+    def incrementCount(self, key):
+        count = self.counts.get(key)
+        if count is None:
+            self.counts[key] = self.baseCount(key) + 1
+            self.evictIfFull(key)
+        else:
+            self.counts[key] = count + 1
+            if self.trackRecency:
+                self.counts.move_to_end(key)
+
+    def evictIfFull(self, newKey):
+        """
+        Evicts keys until the table is back within maxEntries. The key that was
+        just added is never evicted
+        Args:
+            newKey: the key that was just added
+        """
+        if not self.maxEntries or len(self.counts) <= self.maxEntries:
+            return
+        if self.trackRecency:
+            while len(self.counts) > self.maxEntries:
+                key, _ = self.counts.popitem(last=False)
+                self.values.pop(key, None)
+                self.evictions += 1
+        else:
+            # Evicts a tenth of the table at once, so the selection cost is shared between many insertions
+            excess = len(self.counts) - self.maxEntries + max(1, self.maxEntries // 10)
+            victims = heapq.nsmallest(excess + 1, self.counts.items(), key=lambda item: item[1])
+            for key, _ in victims:
+                if excess == 0:
+                    break
+                if key == newKey:
+                    continue
+                del self.counts[key]
+                self.values.pop(key, None)
+                self.evictions += 1
+                excess -= 1
+
+    @staticmethod
+    def merge(master: "QTable", tables: list) -> "QTable":
+        """
+        Merges tables that were trained in parallel, each starting from a copy of the master table.
+        Visit counts add up what every table learned on top of the master. Q-values are averaged
+        over the tables that visited the key since the copy, weighted by their new visits, so a key
+        only one table learned takes that table's value. A key no table visited keeps the mean of
+        the tables that changed it (e.g. by replay), or the master's value
+        Args:
+            master: the table all the others started from
+            tables: the tables trained from copies of the master
+        Returns:
+            A new table with the same bound and eviction policy as the master. When evicting by
+            recency, the merged keys are ordered by their most recent use in any of the tables
+        """
+        merged = QTable(master.maxEntries, master.eviction)
+        merged.base = master.base
+        keys = set(master.counts)
+        for table in tables:
+            keys.update(table.counts)
+        if merged.trackRecency:
+            # The tables were used at the same time, so there is no common clock: the recency of a key is
+            # the latest of its positions from least to most recently used in each table, scaled to [0, 1]
+            recency = {}
+            for table in [master] + tables:
+                size = len(table.counts)
+                for position, key in enumerate(table.counts):
+                    recency[key] = max(recency.get(key, 0.0), (position + 1) / size)
+            keys = sorted(keys, key=recency.__getitem__)
+        for key in keys:
+            count = master.getCount(key)
+            merged.counts[key] = count + sum(max(0, table.getCount(key) - count) for table in tables)
+        keys = set()
+        for table in tables:
+            keys.update(table.values)
+        for key in keys:
+            count = master.getCount(key)
+            previous = master.peekValue(key)
+            weights = [max(0, table.getCount(key) - count) for table in tables]
+            values = [table.peekValue(key) for table in tables]
+            total = sum(weights)
+            if total:
+                value = sum(weight * value for weight, value in zip(weights, values)) / total
+            else:
+                changed = [table.values[key] for table in tables if table.values.get(key, previous) != previous]
+                value = sum(changed) / len(changed) if changed else previous
+            if value != 0 or (merged.base is not None and merged.base.getValue(key)):
+                merged.values[key] = value
+        merged.lookups = master.lookups + sum(table.lookups - master.lookups for table in tables)
+        merged.hits = master.hits + sum(table.hits - master.hits for table in tables)
+        merged.evictions = master.evictions + sum(table.evictions - master.evictions for table in tables)
+        merged.evictIfFull(None)
+        return merged
+
+    def save(self, path: str, episodes: int = 0):
+        """
+        Writes the table, including what it read from the checkpoint it was loaded from, to a checkpoint.
+        The file is written next to the path and then moved over it, so an interrupted save
+        leaves the previous checkpoint intact
+        Args:
+            path: the checkpoint file
+            episodes: number of episodes the table was trained for
+        """
+        rows = {}
+        if self.base is not None:
+            for stateKey, values, counts in self.base.rowsItems():
+                rows[stateKey] = (values, counts)
+        for key in set(self.values) | set(self.counts):
+            stateKey, action = key
+            if stateKey not in rows:
+                rows[stateKey] = ([0.0] * len(ACTIONS), [0] * len(ACTIONS))
+            values, counts = rows[stateKey]
+            column = ACTION_COLUMN[action]
+            values[column] = self.peekValue(key)
+            counts[column] = self.getCount(key)
+        packed = [(packStateKey(stateKey), values, counts) for stateKey, (values, counts) in rows.items()
+                  if any(values) or any(counts)]
+        keyWidth = max([len(key) for key, _, _ in packed] or [0])
+        packed = sorted((key.ljust(keyWidth, b"\0"), values, counts) for key, values, counts in packed)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, keyWidth, len(packed), episodes))
+            for key, values, counts in packed:
+                f.write(key)
+                f.write(CHECKPOINT_ROW.pack(*(values + counts)))
+        os.replace(temporary, path)
+
+    @staticmethod
+    def load(path: str, maxEntries: int = 0, eviction: str = EVICT_LRU) -> "QTable":
+        """
+        Returns a table that reads through to the memory-mapped checkpoint.
+        The number of episodes it was trained for is in table.base.episodes
+        """
+        table = QTable(maxEntries, eviction)
+        table.base = MappedQTable(path)
+        return table
+
+    def stats(self) -> dict:
+        return {"entries": len(self.values),
+                "counted": len(self.counts),
+                "lookups": self.lookups,
+                "hitRate": self.hits / self.lookups if self.lookups else 0.0,
+                "evictions": self.evictions}
+
+    def describe(self) -> str:
+        stats = self.stats()
+        return "Q-table: %d entries, %d counted keys, %d lookups, %.1f%% hit rate, %d evictions" % (
+            stats["entries"], stats["counted"], stats["lookups"], 100 * stats["hitRate"], stats["evictions"])
+
+
+class DenseQTable:
+    """
+    Q-table for layouts whose states can all be enumerated. Every state key maps to a
+    row of a NumPy array (see stateIndex), with a column for each of the four moves,
+    so there is nothing to hash and the best Q-value of a state is a single row max.
+    Created with DenseQTable.forState, which returns None when the layout has too many states
+    """
+
+    # Actions with a column in the table. Pacman's STOP is never taken, so it has none
+    MOVES = ACTIONS[:4]
+    MOVE_COLUMN = dict((action, column) for column, action in enumerate(MOVES))
+
+    def __init__(self, pacmanCells: dict, ghostSlots: dict, ghostCount: int, foodBits: list, capsules: list):
+        """
+        Args:
+            pacmanCells: index of each walkable cell
+            ghostSlots: index of each position a ghost can be at, in half cells (see halfCells)
+            ghostCount: number of ghosts
+            foodBits: bits of GameStateFeatures' food bitmask where there is food at the start
+            capsules: positions of the capsules at the start
+        """
+        self.pacmanCells = pacmanCells
+        self.ghostSlots = ghostSlots
+        self.ghostCount = ghostCount
+        self.foodBits = foodBits
+        self.capsules = capsules
+        self.capsuleBits = dict((capsule, 1 << bit) for bit, capsule in enumerate(capsules))
+        self.numStates = DenseQTable.countStates(len(pacmanCells), len(ghostSlots), ghostCount, len(foodBits),
+                                                 len(capsules))
+        self.values = numpy.zeros((self.numStates, len(DenseQTable.MOVES)))
+        self.counts = numpy.zeros((self.numStates, len(DenseQTable.MOVES)), dtype=numpy.uint32)
+        self.makeViews()
+        # The state keys and rows of the last two lookups: the agent looks up all the actions of a state
+        # in a row, and goes back and forth between a state and the next one when it learns
+        self.lastStateKey = None
+        self.lastIndex = 0
+        self.previousStateKey = None
+        self.previousIndex = 0
+        # Statistics, as for QTable
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def makeViews(self):
+        # Flat views of the arrays, element (row, column) at row * 4 + column. Indexing a memoryview
+        # returns a Python number directly, which is much quicker than indexing a NumPy array one element at a time
+        self.valueView = memoryview(self.values).cast("B").cast("d")
+        self.countView = memoryview(self.counts).cast("B").cast("I")
+
+    # Memoryviews cannot be pickled (e.g. for parallel training), so they are made again for copies
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["valueView"]
+        del state["countView"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.makeViews()
+
+    # A table for the same layout with nothing learned yet
+    def emptyCopy(self) -> "DenseQTable":
+        return DenseQTable(self.pacmanCells, self.ghostSlots, self.ghostCount, self.foodBits, self.capsules)
+
+    @staticmethod
+    def countStates(pacmanCells: int, ghostSlots: int, ghostCount: int, foodCount: int, capsuleCount: int) -> int:
+        # Pacman's cell, every ghost's position and whether it is scared, which food and capsules are left
+        return pacmanCells * (ghostSlots * 2) ** ghostCount * 2 ** foodCount * 2 ** capsuleCount
+
+    @staticmethod
+    def forState(state, maxStates: int):
+        """
+        Dense table for the layout of the given (initial) state, None if the layout has more
+        than maxStates states or NumPy is not installed
+        """
+        if not _NUMPY_ENABLED:
+            return None
+        walls = state.getWalls()
+        cells = [(x, y) for x in range(walls.width) for y in range(walls.height) if not walls[x][y]]
+        # Ghosts move half a cell at a time while they are scared, so they can also be halfway between two cells
+        halfCells = set((2 * x, 2 * y) for x, y in cells)
+        for x, y in cells:
+            for neighbour in ((x + 1, y), (x, y + 1)):
+                if not walls[neighbour[0]][neighbour[1]]:
+                    halfCells.add((x + neighbour[0], y + neighbour[1]))
+        food = state.getFood()
+        foodBits = [x * food.height + y for x in range(food.width) for y in range(food.height) if food[x][y]]
+        capsules = list(state.getCapsules())
+        ghostCount = state.getNumAgents() - 1
+        if DenseQTable.countStates(len(cells), len(halfCells), ghostCount, len(foodBits), len(capsules)) > maxStates:
+            return None
+        pacmanCells = dict((cell, index) for index, cell in enumerate(cells))
+        ghostSlots = dict((cell, index) for index, cell in enumerate(sorted(halfCells)))
+        return DenseQTable(pacmanCells, ghostSlots, ghostCount, foodBits, capsules)
+
+    def stateIndex(self, stateKey: tuple) -> int:
+        """
+        Row of the state: a mixed radix number with a digit for pacman's cell, each ghost's
+        position and scared flag, and a bit for each piece of food and capsule still left
+        """
+        if stateKey is self.lastStateKey:
+            return self.lastIndex
+        if stateKey is self.previousStateKey:
+            self.previousStateKey, self.lastStateKey = self.lastStateKey, stateKey
+            self.previousIndex, self.lastIndex = self.lastIndex, self.previousIndex
+            return self.lastIndex
+        pacman, ghosts, scared, food, capsules = stateKey
+        index = self.pacmanCells[pacman]
+        for ghost, isScared in zip(ghosts, scared):
+            index = (index * len(self.ghostSlots) + self.ghostSlots[(int(ghost[0] * 2), int(ghost[1] * 2))]) * 2 + \
+                isScared
+        for bit in self.foodBits:
+            index = index * 2 + ((food >> bit) & 1)
+        capsuleMask = 0
+        for capsule in capsules:
+            capsuleMask |= self.capsuleBits[capsule]
+        index = (index << len(self.capsules)) | capsuleMask
+        self.previousStateKey, self.lastStateKey = self.lastStateKey, stateKey
+        self.previousIndex, self.lastIndex = self.lastIndex, index
+        return index
+
+    def __len__(self) -> int:
+        return int(numpy.count_nonzero(self.values))
+
+    def getValue(self, key) -> float:
+        self.lookups += 1
+        column = DenseQTable.MOVE_COLUMN.get(key[1])
+        if column is None:
+            return 0.0
+        element = self.stateIndex(key[0]) * 4 + column
+        # As for QTable, a hit is an entry that has been learned, i.e. taken at least once
+        if self.countView[element]:
+            self.hits += 1
+        return self.valueView[element]
+
+    def setValue(self, key, value: float):
+        self.valueView[self.stateIndex(key[0]) * 4 + DenseQTable.MOVE_COLUMN[key[1]]] = value
+
+    def getCount(self, key) -> int:
+        column = DenseQTable.MOVE_COLUMN.get(key[1])
+        if column is None:
+            return 0
+        return self.countView[self.stateIndex(key[0]) * 4 + column]
+
+    def incrementCount(self, key):
+        self.countView[self.stateIndex(key[0]) * 4 + DenseQTable.MOVE_COLUMN[key[1]]] += 1
+
+    def maxValue(self, stateKey) -> float:
+        """
+        The highest Q-value of the actions that have been taken in the state, 0 if none has
+        (the max of the state's row, over the columns with a count)
+        """
+        start = self.stateIndex(stateKey) * 4
+        counts = self.countView
+        values = self.valueView
+        best = None
+        for element in range(start, start + 4):
+            if counts[element] and (best is None or values[element] > best):
+                best = values[element]
+        return 0.0 if best is None else best
+
+    def learnBatch(self, rows, columns, rewards, nextRows, terminal, alpha: float, gamma: float):
+        """
+        Same as QTable.learnBatch, on the rows and columns of the table
+        Args:
+            rows, columns: states and actions of the transitions
+            rewards: their rewards
+            nextRows: the states they lead to
+            terminal: whether those states end the game
+        """
+        nextValues = numpy.where(self.counts[nextRows] > 0, self.values[nextRows], -numpy.inf).max(axis=1)
+        nextValues[numpy.isneginf(nextValues) | terminal] = 0.0
+        errors = rewards + gamma * nextValues - self.values[rows, columns]
+        elements, inverse, repeats = numpy.unique(rows * 4 + columns, return_inverse=True, return_counts=True)
+        self.values.reshape(-1)[elements] += alpha * numpy.bincount(inverse, weights=errors) / repeats
+
+    def stateKeys(self):
+        """
+        Yields the index and key of every state that has a Q-value or count (the inverse of stateIndex)
+        """
+        cells = sorted(self.pacmanCells, key=self.pacmanCells.get)
+        slots = sorted(self.ghostSlots, key=self.ghostSlots.get)
+        for index in numpy.flatnonzero(self.values.any(axis=1) | self.counts.any(axis=1)):
+            rest = int(index)
+            capsules = tuple(capsule for bit, capsule in enumerate(self.capsules) if (rest >> bit) & 1)
+            rest >>= len(self.capsules)
+            food = 0
+            for bit in reversed(self.foodBits):
+                food |= (rest & 1) << bit
+                rest >>= 1
+            ghosts = []
+            scared = []
+            for _ in range(self.ghostCount):
+                scared.append(bool(rest % 2))
+                rest //= 2
+                x, y = slots[rest % len(slots)]
+                ghosts.append((unpackCoordinate(x), unpackCoordinate(y)))
+                rest //= len(slots)
+            yield int(index), (cells[rest], tuple(reversed(ghosts)), tuple(reversed(scared)), food, capsules)
+
+    def toSparse(self) -> QTable:
+        """
+        The same Q-values and counts in a (sparse) QTable
+        """
+        table = QTable()
+        for index, stateKey in self.stateKeys():
+            for column, action in enumerate(DenseQTable.MOVES):
+                if self.values[index, column] != 0:
+                    table.values[(stateKey, action)] = float(self.values[index, column])
+                if self.counts[index, column]:
+                    table.counts[(stateKey, action)] = int(self.counts[index, column])
+        return table
+
+    def save(self, path: str, episodes: int = 0):
+        self.toSparse().save(path, episodes)
+
+    @staticmethod
+    def merge(master: "DenseQTable", tables: list) -> "DenseQTable":
+        """
+        Same as QTable.merge, on whole arrays
+        """
+        merged = master.emptyCopy()
+        counts = numpy.array([table.counts for table in tables], dtype=numpy.int64)
+        values = numpy.array([table.values for table in tables])
+        visits = numpy.maximum(counts - master.counts, 0)
+        merged.counts[:] = master.counts + visits.sum(axis=0)
+        total = visits.sum(axis=0)
+        weighted = (visits * values).sum(axis=0) / numpy.maximum(total, 1)
+        changed = values != master.values
+        changes = changed.sum(axis=0)
+        meanChanged = (changed * values).sum(axis=0) / numpy.maximum(changes, 1)
+        merged.values[:] = numpy.where(total > 0, weighted, numpy.where(changes > 0, meanChanged, master.values))
+        merged.lookups = master.lookups + sum(table.lookups - master.lookups for table in tables)
+        merged.hits = master.hits + sum(table.hits - master.hits for table in tables)
+        merged.evictions = master.evictions + sum(table.evictions - master.evictions for table in tables)
+        return merged
+
+    def stats(self) -> dict:
+        return {"entries": len(self),
+                "counted": int(numpy.count_nonzero(self.counts)),
+                "lookups": self.lookups,
+                "hitRate": self.hits / self.lookups if self.lookups else 0.0,
+                "evictions": self.evictions}
+
+    def describe(self) -> str:
+        return "Dense " + QTable.describe(self) + " (%d states)" % self.numStates
@@ -0,0 +1,93 @@
+# replay.py
+#
+# Experience replay for QLearnAgent.
+#
+# The transitions the agent experiences are kept in a ring buffer of fixed
+# size, allocated up front, and a sample of them is learned from again after
+# every step or episode, so that every simulated episode is learned from more
+# than once.
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import random
+from array import array
+
+try:
+    import numpy
+    _NUMPY_ENABLED = True
+except ImportError:
+    _NUMPY_ENABLED = False
+
+
+class ReplayBuffer:
+    """
+    Ring buffer of (state, action, reward, next state, terminal) transitions.
+    For a sparse Q-table states are GameStateFeatures keys and actions are Directions.
+    For a dense one (rows=True) they are the rows and columns of the table, in NumPy
+    arrays, so that a sample can be learned from in a few array operations
+    """
+
+    def __init__(self, capacity: int, rows: bool = False, seed: int = 0):
+        """
+        Args:
+            capacity: number of transitions kept, the oldest are overwritten first
+            rows: whether states and actions are dense table rows and columns
+            seed: seed of the generator the transitions are sampled with
+        """
+        self.capacity = capacity
+        self.rows = rows
+        self.size = 0
+        self.next = 0
+        if rows:
+            self.states = numpy.zeros(capacity, dtype=numpy.int64)
+            self.actions = numpy.zeros(capacity, dtype=numpy.int8)
+            self.rewards = numpy.zeros(capacity)
+            self.nextStates = numpy.zeros(capacity, dtype=numpy.int64)
+            self.terminal = numpy.zeros(capacity, dtype=bool)
+        else:
+            self.states = [None] * capacity
+            self.actions = [None] * capacity
+            self.rewards = array('d', bytes(8 * capacity))
+            self.nextStates = [None] * capacity
+            self.terminal = bytearray(capacity)
+        # Sampling has its own generator, seeded without drawing from the global one,
+        # so that turning replay on does not change the games that are played. NumPy's is used
+        # whenever it is available, so that sparse and dense buffers sample the same slots
+        self.random = random.Random(seed)
+        self.generator = numpy.random.default_rng(seed) if _NUMPY_ENABLED else None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, state, action, reward: float, nextState, terminal: bool):
+        slot = self.next
+        self.states[slot] = state
+        self.actions[slot] = action
+        self.rewards[slot] = reward
+        self.nextStates[slot] = nextState
+        self.terminal[slot] = terminal
+        self.next = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, count: int):
+        """
+        Slots of count transitions picked uniformly at random (with replacement), as a NumPy
+        array for a dense buffer and a list otherwise
+        """
+        if self.generator is None:
+            return [self.random.randrange(self.size) for _ in range(count)]
+        slots = self.generator.integers(0, self.size, count)
+        return slots if self.rows else slots.tolist()
+
+    def transitions(self, slots):
+        """
+        The states, actions, rewards, next states and terminal flags of the transitions in the slots,
+        in the arguments order of the Q-tables' learnBatch
+        """
+        if self.rows:
+            return (self.states[slots], self.actions[slots], self.rewards[slots], self.nextStates[slots],
+                    self.terminal[slots])
+        return ([self.states[slot] for slot in slots], [self.actions[slot] for slot in slots],
+                [self.rewards[slot] for slot in slots], [self.nextStates[slot] for slot in slots],
+                [self.terminal[slot] for slot in slots])